@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Compares the archives pyppd builds from a PPDs directory with the PPDs in
+# the order of their paths and in the order of their similarity, for a few
+# block sizes: their size and how long building them takes.
+#
+# usage: bench-order.py PPDS_DIRECTORY [CODEC [BLOCK_SIZE...]]
+#
+# The PPDs are read once, from the page cache, before timing anything.
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import pyppd.archiver
+
+def bench(directory, block_size, codec, order, delta):
+    start = time.perf_counter()
+    archive = pyppd.archiver.archive(directory, block_size, codec,
+                                     delta=delta, order=order)
+    return len(archive), time.perf_counter() - start
+
+def run():
+    if len(sys.argv) < 2:
+        sys.exit("usage: %s PPDS_DIRECTORY [CODEC [BLOCK_SIZE...]]"
+                 % sys.argv[0])
+    directory = sys.argv[1]
+    codec = sys.argv[2] if len(sys.argv) > 2 else pyppd.archiver.CODEC
+    block_sizes = [int(size) for size in sys.argv[3:]] or \
+        [64 << 10, pyppd.archiver.BLOCK_SIZE]
+    logging.basicConfig(level=logging.WARNING)
+
+    for path, filename in pyppd.archiver.find_ppds(directory):
+        pyppd.archiver.read_ppd(path)
+    print("%10s %-10s %-5s %12s %9s" % ("block", "order", "delta", "bytes",
+                                        "seconds"))
+    for block_size in block_sizes:
+        for delta in (False, True):
+            for order in pyppd.archiver.ORDERS:
+                size, seconds = bench(directory, block_size, codec, order,
+                                      delta)
+                print("%10d %-10s %-5s %12d %9.2f" % (block_size, order,
+                                                      delta, size, seconds))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Measures how many PPDs per second pyppd.reader serves to coroutines, for a
+# growing number of decompression threads.
+#
+# usage: bench-reader.py ARCHIVE [REQUESTS]
+#
+# The cache is disabled, so every request decompresses its blocks: the
+# throughput should grow with the number of threads, up to the number of
+# cores.
+
+import os
+import sys
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from pyppd.reader import Archive
+
+def bench(path, uris, jobs):
+    with Archive(path, cache_size=0, jobs=jobs) as archive:
+        async def serve():
+            await asyncio.gather(*[archive.aget(uri) for uri in uris])
+        start = time.perf_counter()
+        asyncio.run(serve())
+        return len(uris) / (time.perf_counter() - start)
+
+def run():
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: %s ARCHIVE [REQUESTS]" % sys.argv[0])
+    path = sys.argv[1]
+    requests = int(sys.argv[2]) if len(sys.argv) == 3 else 1000
+
+    with Archive(path) as archive:
+        entries = [entry.uri for entry in archive.entries()]
+    random.seed(0)
+    uris = [random.choice(entries) for i in range(requests)]
+
+    jobs = 1
+    while True:
+        print("%3d threads: %8.1f PPDs/s" % (jobs, bench(path, uris, jobs)))
+        if jobs >= (os.cpu_count() or 1):
+            break
+        jobs = min(2 * jobs, os.cpu_count())
+
+if __name__ == "__main__":
+    run()
@@ -1,13 +1,24 @@
-import base64
-import sys
 import os
+import re
 import fnmatch
 import gzip
+import json
+import hashlib
+import base64
 import logging
+import marshal
+import zipfile
+import stat
+import tempfile
+import importlib.util
+from io import BytesIO
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-import json
 
 import pyppd.compressor
+import pyppd.delta
 import pyppd.ppd
 
 try:
@@ -20,23 +31,388 @@ except ImportError:
     except ImportError:
         resource_files = None  # Handle development environment fallback
 
-def archive(ppds_directory):
+# Fixed timestamp for the zip members, so archives are reproducible
+ARCHIVE_DATE = (1980, 1, 1, 0, 0, 0)
+# marshal format of the index: version 3 and later share references to
+# equal objects depending on how they were built, which would make archives
+# of the same PPDs differ
+MARSHAL_VERSION = 2
+# Uncompressed size of the independently compressed blocks of PPDs. "cat"
+# only decompresses the blocks holding the PPD it was asked for.
+BLOCK_SIZE = 1 << 20
+# Default codec of the blocks, see pyppd.compressor.CODECS
+CODEC = "xz"
+# Maximum size of the PPDs sampled to train the codec's dictionary
+DICTIONARY_SAMPLES_SIZE = 16 << 20
+# Size of the chunks gzipped PPDs are decompressed in
+GZIP_CHUNK_SIZE = 64 << 10
+# Number of most requested PPDs put in their own blocks at the start of the
+# archive, when weights are given
+HOT_PPDS = 100
+# Orders of the PPDs in the archive: by filename, or similar ones together
+# (see order_ppds())
+ORDERS = ("name", "similarity")
+ORDER = "name"
+# A PPD's description, as listed by the archives
+DESCRIPTION_RE = re.compile(r'"(.*?)" (\S+) "(.*?)" "(.*)" "(.*?)"$')
+# The driver field of a Device ID
+DRV_RE = re.compile(r'DRV:\s*(.*?)\s*;', re.I)
+
+# The compressed PPDs: the name of their codec and its trained dictionary,
+# the (start, offset, size) of each block (see compress_blocks()) and the
+# compressed blocks themselves
+Payload = namedtuple('Payload', 'codec dictionary blocks compressed')
+
+def archive(ppds_directory, block_size=BLOCK_SIZE, codec=CODEC,
+            weights=None, hot=HOT_PPDS, delta=False, order=ORDER, jobs=None):
     """Returns executable archive with decompressor and compressed PPDs."""
-    # Compression logic
-    ppds_compressed = compress(ppds_directory)
-    
-    # Read template
-    template_path = Path(__file__).parent / "pyppd-ppdfile.in"
-    with open(template_path, "rb") as f:
-        template = f.read()
-    
-    # Read compressor code
+    output = BytesIO()
+    if not write(output, ppds_directory, block_size, codec, weights, hot,
+                 delta, order, jobs):
+        return None
+    return output.getvalue()
+
+def write(output, ppds_directory, block_size=BLOCK_SIZE, codec=CODEC,
+          weights=None, hot=HOT_PPDS, delta=False, order=ORDER, jobs=None):
+    """Writes executable archive of the PPDs in ppds_directory to output.
+
+    output is a binary file. Reading and parsing the PPDs, compressing
+    them and writing them to output overlap, using pools of jobs threads.
+    The archive is the same whatever the number of jobs. Returns False,
+    having written only part of the archive, when there are no PPDs.
+    """
+    template = read_file_in_syspath("pyppd-ppdfile.in")
+    output.write(shebang(template))
+    compressed = compress(ppds_directory, block_size, codec, weights, hot,
+                          delta, order, output=output, jobs=jobs)
+    if not compressed:
+        return False
+    output.write(archive_zip(template, *compressed))
+    return True
+
+def build(ppds_index, ppds_list, ppds_payload):
+    """Returns executable archive with the already compressed PPDs."""
+    template = read_file_in_syspath("pyppd-ppdfile.in")
+    return (shebang(template) + ppds_payload.compressed +
+            archive_zip(template, ppds_index, ppds_list, ppds_payload))
+
+def shebang(template):
+    """Returns the "#!" line starting the archives."""
+    return template[:template.index(b"\n") + 1]
+
+def archive_zip(template, ppds_index, ppds_list, ppds_payload):
+    """Returns the zip ending the archive, after its compressed PPDs.
+
+    The archive is a zipapp: the "#!" line, the raw compressed PPDs, then a
+    zip with the decompressor as __main__ and the modules it imports, the
+    index, the codec's dictionary, the prebuilt output of "list" and the
+    digest of the last three (see pyppd.catalog). Python finds the zip from
+    the end of the file, so the payload is never parsed.
+    """
     compressor_py = read_file_in_syspath("compressor.py")
-    
-    # Perform substitutions
-    ppds_compressed_b64 = base64.b64encode(ppds_compressed)
-    return template.replace(b"@compressor@", compressor_py)\
-                  .replace(b"@ppds_compressed_b64@", ppds_compressed_b64)
+    delta_py = read_file_in_syspath("delta.py")
+    payload_size = sum(size for start, offset, size in ppds_payload.blocks)
+    index = {
+        'payload': (len(shebang(template)), payload_size),
+        'codec': ppds_payload.codec,
+        'blocks': ppds_payload.blocks,
+        'ppds': ppds_index,
+    }
+    index = marshal.dumps(index, MARSHAL_VERSION)
+    ppds_list = list_text(ppds_list)
+    members = [
+        ("__main__.py", template, zipfile.ZIP_DEFLATED),
+        ("__main__.pyc", compile_module(template, "__main__.py"),
+         zipfile.ZIP_DEFLATED),
+        ("compressor.py", compressor_py, zipfile.ZIP_DEFLATED),
+        ("compressor.pyc", compile_module(compressor_py, "compressor.py"),
+         zipfile.ZIP_DEFLATED),
+        ("delta.py", delta_py, zipfile.ZIP_DEFLATED),
+        ("delta.pyc", compile_module(delta_py, "delta.py"),
+         zipfile.ZIP_DEFLATED),
+        ("index", index, zipfile.ZIP_DEFLATED),
+        ("dictionary", ppds_payload.dictionary, zipfile.ZIP_DEFLATED),
+        ("list", ppds_list, zipfile.ZIP_DEFLATED),
+        ("digest", digest(index, ppds_payload.dictionary, ppds_list),
+         zipfile.ZIP_STORED),
+    ]
+    return zip_members(members)
+
+def digest(*members):
+    """Returns the hexadecimal SHA-256 digest of the members' contents."""
+    sha256 = hashlib.sha256()
+    for member in members:
+        sha256.update(len(member).to_bytes(8, "little"))
+        sha256.update(member)
+    return sha256.hexdigest().encode("ascii")
+
+@contextmanager
+def replace_file(path, executable=True):
+    """Yields a binary file which replaces the one at path once closed.
+
+    The file is written next to path and atomically renamed to it, so a
+    half-written archive is never visible at path, even when interrupted.
+    The file is synced to disk before the rename, and the rename after it,
+    so that path isn't left empty or truncated by a crash either. It keeps
+    the mode of the file it replaces, or gets the default one, and is
+    executable by its owner unless told otherwise. Nothing is replaced if
+    an exception (or SystemExit) is raised.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(prefix=f".{filename}.", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        if executable:
+            mode |= stat.S_IEXEC
+        os.chmod(temporary, mode)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def reindex(archive, block_size=BLOCK_SIZE, codec=CODEC,
+            weights=None, hot=HOT_PPDS, delta=False, order=ORDER, jobs=None):
+    """Returns archive rebuilt with its PPDs compressed in blocks.
+
+    archive may be any archive generated by pyppd, including the older ones
+    embedding a single xz stream in the script, which "cat" had to
+    decompress from the start. Blocks are compressed by a pool of jobs
+    threads, as in compress_blocks().
+    """
+    ppds_index, ppds_list, ppds = extract(archive)
+    # Lay the PPDs out in the order of the index, as compress() does, the
+    # hot ones first, each ending its block
+    hot_filenames = hottest(ppds_index, weights, hot) if weights else []
+    filenames = hot_filenames + [filename for filename in ppds_index
+                                 if filename not in hot_filenames]
+    ppds, ppds_index = rearrange(ppds, ppds_index, filenames)[:2]
+    breaks = [sum(ppds_index[filename]) for filename in hot_filenames]
+    if order == "similarity":
+        ppds_descriptions = {}
+        for description in ppds_list:
+            match = DESCRIPTION_RE.match(description)
+            if match:
+                uri = match.group(1)
+                ppds_descriptions.setdefault(uri[uri.find("/") + 1:],
+                                             []).append(description)
+        ppds, ppds_index, breaks = order_ppds(ppds, ppds_index,
+                                              ppds_descriptions, breaks,
+                                              hot_filenames)
+    if delta:
+        ppds, ppds_index, breaks = encode_deltas(ppds, ppds_index, breaks,
+                                                 hot_filenames)
+    ppds_payload = compress_blocks(ppds, block_size, codec,
+                                   spans(ppds_index), breaks, jobs)
+    # Sort the index as compress() does, so archives are reproducible
+    ppds_index = dict(sorted(ppds_index.items()))
+    return build(ppds_index, ppds_list, ppds_payload)
+
+def extract(archive):
+    """Returns the (ppds_index, ppds_list, ppds) of an existing archive.
+
+    Raises ValueError if archive isn't an archive generated by pyppd.
+    """
+    legacy = re.search(rb'\nppds_compressed_b64 = b"([^"]*)"', archive)
+    if legacy:
+        # Archives with the index and the PPDs as base64 encoded JSON
+        ppds_json = json.loads(pyppd.compressor.decompress(
+            base64.b64decode(legacy.group(1))))
+        ppds = pyppd.compressor.decompress(
+            base64.b64decode(ppds_json.pop('ARCHIVE')))
+        ppds_index = {}
+        ppds_list = []
+        for uri, (start, length, descriptions) in sorted(ppds_json.items()):
+            filename = uri[uri.find("/") + 1:]
+            if filename not in ppds_index:
+                ppds_index[filename] = (start, length)
+                ppds_list += descriptions
+        return dict(sorted(ppds_index.items())), ppds_list, ppds
+
+    try:
+        with zipfile.ZipFile(BytesIO(archive)) as z:
+            index = marshal.loads(z.read("index"))
+            dictionary = z.read("dictionary")
+            ppds_list = z.read("list").decode("utf-8")
+    except (zipfile.BadZipFile, KeyError, EOFError) as e:
+        # Not a zip, or a zip without the archive's members
+        raise ValueError("Not a pyppd archive") from e
+    codec = pyppd.compressor.get_codec(index['codec'])
+    payload = archive[index['payload'][0]:]
+    ppds = bytearray()
+    for start, offset, size in index['blocks']:
+        ppds.extend(codec.decompress(payload[offset:offset + size], dictionary))
+    ppds_list = ['"' + ppd for ppd in ppds_list.split("\n")] if ppds_list else []
+    ppds_index = index['ppds']
+    if any(len(entry) == 3 for entry in ppds_index.values()):
+        ppds, ppds_index = decode_deltas(ppds, ppds_index)
+    return ppds_index, ppds_list, ppds
+
+def rearrange(ppds, ppds_index, filenames, breaks=()):
+    """Returns ppds with the PPDs in the order of filenames.
+
+    Returns a (ppds, ppds_index, breaks) tuple, the breaks following the
+    PPDs ending at them. The filenames must all be in ppds_index.
+    """
+    breaks = set(breaks)
+    ppds_ordered = bytearray()
+    ppds_index_ordered = {}
+    breaks_ordered = []
+    for filename in filenames:
+        start, length = ppds_index[filename]
+        ppds_index_ordered[filename] = (len(ppds_ordered), length)
+        ppds_ordered.extend(ppds[start:start + length])
+        if start + length in breaks:
+            breaks_ordered.append(len(ppds_ordered))
+    # The index keeps its order
+    ppds_index_ordered = {filename: ppds_index_ordered[filename]
+                          for filename in ppds_index}
+    return ppds_ordered, ppds_index_ordered, breaks_ordered
+
+def order_ppds(ppds, ppds_index, ppds_descriptions, breaks=(), plain=()):
+    """Returns ppds reordered to put similar PPDs next to each other.
+
+    PPDs are grouped by manufacturer, then by the driver named by the DRV
+    field of their Device ID, as given by their ppds_descriptions, and the
+    PPDs of each group by similarity (see pyppd.delta.cluster()): each
+    base is followed by the PPDs similar to it, so they share blocks and
+    the codec's window. The PPDs whose filenames are in plain (e.g. the
+    hot ones) keep their place. Only the payload changes, the URIs don't.
+    Returns a (ppds, ppds_index, breaks) tuple, as rearrange().
+    """
+    def group(filename):
+        description = DESCRIPTION_RE.match(
+            ppds_descriptions.get(filename, [""])[0])
+        if not description:
+            return "", ""
+        drv = DRV_RE.search(description.group(5))
+        return description.group(3).lower(), drv.group(1) if drv else ""
+
+    plain = set(plain)
+    filenames = sorted(ppds_index, key=lambda filename: ppds_index[filename])
+    groups = {}
+    for filename in filenames:
+        if filename not in plain:
+            groups.setdefault(group(filename), []).append(filename)
+
+    ordered = [filename for filename in filenames if filename in plain]
+    for key in sorted(groups):
+        filenames = groups[key]
+        sketches = []
+        for filename in filenames:
+            start, length = ppds_index[filename]
+            sketches.append(pyppd.delta.sketch(
+                bytes(ppds[start:start + length])))
+        clusters = {}
+        for i, base in enumerate(pyppd.delta.cluster(sketches)):
+            clusters.setdefault(i if base is None else base,
+                                []).append(filenames[i])
+        for cluster in clusters.values():
+            ordered.extend(cluster)
+    return rearrange(ppds, ppds_index, ordered, breaks)
+
+def encode_deltas(ppds, ppds_index, breaks=(), plain=()):
+    """Returns ppds with the PPDs similar to others stored as deltas.
+
+    PPDs are clustered by the similarity of their lines, and the ones with
+    a base in their cluster are stored as the delta from it (see
+    pyppd.delta) when it is small enough. Their entry in ppds_index then
+    names the base: (start, length, base). The PPDs whose filenames are in
+    plain (e.g. the hot ones) are kept whole, so "cat" only decompresses
+    their own blocks. Returns a (ppds, ppds_index, breaks) tuple, with the
+    PPDs in the same order and the breaks following them.
+    """
+    filenames = sorted(ppds_index, key=lambda filename: ppds_index[filename])
+    texts = [bytes(ppds[start:start + length])
+             for start, length in (ppds_index[filename]
+                                   for filename in filenames)]
+    bases = pyppd.delta.cluster([pyppd.delta.sketch(text) for text in texts])
+    breaks = set(breaks)
+    plain = set(plain)
+
+    ppds_encoded = bytearray()
+    ppds_index_encoded = {}
+    breaks_encoded = []
+    for filename, text, base in zip(filenames, texts, bases):
+        start, length = ppds_index[filename]
+        entry = (len(ppds_encoded), length)
+        if base is not None and filename not in plain:
+            delta = pyppd.delta.encode(texts[base], text)
+            if len(delta) <= pyppd.delta.MAX_DELTA_RATIO * length:
+                entry = (len(ppds_encoded), len(delta), filenames[base])
+                text = delta
+        ppds_encoded.extend(text)
+        ppds_index_encoded[filename] = entry
+        if start + length in breaks:
+            breaks_encoded.append(len(ppds_encoded))
+    deltas = sum(len(entry) == 3 for entry in ppds_index_encoded.values())
+    logging.info(f'Stored {deltas} PPDs as deltas, {len(ppds)} bytes of PPDs '
+                 f'down to {len(ppds_encoded)}')
+    return ppds_encoded, ppds_index_encoded, breaks_encoded
+
+def decode_deltas(ppds, ppds_index):
+    """Returns the (ppds, ppds_index) with the deltas replaced by their
+    PPDs, undoing encode_deltas()."""
+    ppds_decoded = bytearray()
+    ppds_index_decoded = {}
+    for filename, entry in sorted(ppds_index.items(),
+                                  key=lambda item: item[1][:2]):
+        start, length = entry[:2]
+        text = ppds[start:start + length]
+        if len(entry) == 3:
+            base_start, base_length = ppds_index[entry[2]]
+            text = pyppd.delta.apply(
+                bytes(ppds[base_start:base_start + base_length]), text)
+        ppds_index_decoded[filename] = (len(ppds_decoded), len(text))
+        ppds_decoded.extend(text)
+    return ppds_decoded, dict(sorted(ppds_index_decoded.items()))
+
+def spans(ppds_index):
+    """Returns the (start, length) of the entries of ppds_index."""
+    return [entry[:2] for entry in ppds_index.values()]
+
+def list_text(ppds_list):
+    """Returns the output of the archive's "list" command, ready to be written.
+
+    Lines are stored without their opening quote: "list" only has to replace
+    every line start by the quote and the driver's name, which isn't known
+    until the archive is run (it can be renamed).
+    """
+    return "\n".join(ppd[1:] for ppd in ppds_list).encode("utf-8")
+
+def compile_module(source, filename):
+    """Returns unchecked hash-based bytecode (PEP 552) for source.
+
+    zipimport loads it without any timestamp check, and falls back to the
+    source when run by another Python version.
+    """
+    code = compile(source, filename, "exec", dont_inherit=True)
+    return (importlib.util.MAGIC_NUMBER + (1).to_bytes(4, "little") +
+            importlib.util.source_hash(source) + marshal.dumps(code))
+
+def zip_members(members):
+    """Returns a zip archive with the (name, data, compress_type) members."""
+    zip_file = BytesIO()
+    with zipfile.ZipFile(zip_file, "w", compresslevel=9) as z:
+        for name, data, compress_type in members:
+            info = zipfile.ZipInfo(name, date_time=ARCHIVE_DATE)
+            info.compress_type = compress_type
+            info.external_attr = 0o644 << 16
+            z.writestr(info, data)
+    return zip_file.getvalue()
 
 def read_file_in_syspath(filename):
     """Read package resources with fallback for development environments."""
@@ -57,49 +433,284 @@ def read_file_in_syspath(filename):
             f"or development path: {target_path}"
         )
 
-def compress(directory):
-    """Compress and index PPD files with proper resource handling."""
-    ppds = bytearray()
+def compress(directory, block_size=BLOCK_SIZE, codec=CODEC,
+             weights=None, hot=HOT_PPDS, delta=False, order=ORDER,
+             output=None, jobs=None):
+    """Compress and index PPD files with proper resource handling.
+
+    Returns a (ppds_index, ppds_list, ppds_payload) tuple, where ppds_index
+    maps each PPD filename to its (start, length) in the uncompressed PPDs,
+    ppds_list holds the description of every entry and ppds_payload is the
+    Payload of the compressed PPDs. When output is given, the compressed
+    PPDs are written to it as they come instead of being kept in the
+    Payload.
+
+    weights optionally maps PPD filenames to how often they are requested
+    (see read_weights()): the hot most requested ones are then put first,
+    each in its own block, so "cat" decompresses as little as possible for
+    them, and the others are packed densely after them.
+
+    order is one of ORDERS: PPDs are put in the archive in the order of
+    their paths, or with similar PPDs together (see order_ppds()). With
+    delta, PPDs similar to others are stored as deltas (see
+    encode_deltas()).
+    """
+    codec = pyppd.compressor.get_codec(codec)
     ppds_index = {}
-    abs_directory = Path(directory).absolute()
+    ppds_descriptions = {}
+
+    ppd_paths = dict(find_ppds(directory))
+    hot_filenames = hottest(ppd_paths.values(), weights, hot) if weights else []
+    hot_paths = sorted((path for path in ppd_paths
+                        if ppd_paths[path] in hot_filenames),
+                       key=lambda path: hot_filenames.index(ppd_paths[path]))
+    hot_paths_set = set(hot_paths)
+    ppd_paths = [(path, ppd_paths[path]) for path in hot_paths] + \
+                [(path, ppd_paths[path]) for path in ppd_paths
+                 if path not in hot_paths_set]
+
+    def ppds():
+        """Yields the chunks of each PPD and whether they end their block,
+        indexing the PPDs."""
+        start = 0
+        for ppd_path, ppd_filename, ppd_chunks, ppd_parsed in \
+                read_ppds(ppd_paths, jobs):
+            length = sum(len(chunk) for chunk in ppd_chunks)
+            logging.debug(f'Found {ppd_path} ({length} bytes)')
+            if ppd_parsed:
+                ppds_index[ppd_filename] = (start, length)
+                ppds_descriptions[ppd_filename] = [str(p) for p in ppd_parsed]
+            start += length
+            for i, chunk in enumerate(ppd_chunks, 1):
+                yield chunk, i == len(ppd_chunks) and ppd_path in hot_paths_set
+
+    if codec.uses_dictionary or delta or order != "name":
+        # The dictionary is trained on all the PPDs, and PPDs are ordered
+        # and encoded as deltas by their similarity to any other one, so
+        # they have to be read before compressing any of them
+        ppds_read = bytearray()
+        breaks = []
+        for ppd_chunk, ends_block in ppds():
+            ppds_read.extend(ppd_chunk)
+            if ends_block:
+                breaks.append(len(ppds_read))
+        if order == "similarity":
+            ppds_read, ppds_index, breaks = order_ppds(
+                ppds_read, ppds_index, ppds_descriptions, breaks,
+                hot_filenames)
+        if delta:
+            ppds_read, ppds_index, breaks = encode_deltas(
+                ppds_read, ppds_index, breaks, hot_filenames)
+        dictionary = codec.train(dictionary_samples(ppds_read,
+                                                    spans(ppds_index)))
+        blocks = ((start, ppds_read[start:end]) for start, end
+                  in block_spans(len(ppds_read), block_size, breaks))
+    else:
+        dictionary = b""
+        blocks = stream_blocks(ppds(), block_size)
+    ppds_blocks, ppds_compressed = compress_stream(codec, dictionary, blocks,
+                                                   output, jobs)
+
+    if not ppds_blocks:
+        logging.error(f'No PPDs found in directory: {directory}')
+        return None
+
+    # Sort the index, so archives are reproducible
+    ppds_index = dict(sorted(ppds_index.items()))
+    ppds_list = [description for filename in ppds_index
+                 for description in ppds_descriptions[filename]]
+    ppds_payload = Payload(codec.name, dictionary, ppds_blocks,
+                           ppds_compressed)
+    return ppds_index, ppds_list, ppds_payload
+
+def read_ppds(ppd_paths, jobs=None):
+    """Yields the PPDs at the (path, filename) ppd_paths, in order.
+
+    The PPDs are read and parsed by a pool of jobs threads, and yielded as
+    (path, filename, ppd_chunks, ppd_parsed) tuples, where ppd_chunks is
+    the list of the PPD's consecutive chunks.
+    """
+    def read_and_parse(ppd_path, ppd_filename):
+        ppd_chunks, ppd_keywords = read_ppd(ppd_path)
+        # Parse PPD to add it to the index
+        ppd_parsed = pyppd.ppd.parse(ppd_keywords, ppd_filename)
+        return ppd_path, ppd_filename, ppd_chunks, ppd_parsed
+
+    return ordered_map(read_and_parse, ppd_paths, jobs)
+
+def read_ppd(ppd_path):
+    """Reads the PPD at ppd_path, which may be gzipped.
+
+    Returns a (ppd_chunks, ppd_keywords) tuple, where ppd_chunks is the
+    list of the PPD's consecutive chunks and ppd_keywords holds what
+    pyppd.ppd.parse() needs of it.
+    """
+    # Handle gzipped PPDs
+    if ppd_path.suffix.lower() == '.gz':
+        # Decompressed in chunks which are compressed in the blocks as they
+        # are, instead of being joined: only the lines parse() needs are
+        # copied apart, as they come
+        scanner = pyppd.ppd.KeywordScanner()
+        ppd_chunks = []
+        with gzip.open(ppd_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(GZIP_CHUNK_SIZE), b''):
+                scanner.feed(chunk)
+                ppd_chunks.append(chunk)
+        return ppd_chunks, scanner.close()
+    with ppd_path.open('rb') as f:
+        ppd_file = f.read()
+    return [ppd_file], ppd_file
+
+def compress_blocks(ppds, block_size=BLOCK_SIZE, codec=CODEC, spans=(),
+                    breaks=(), jobs=None):
+    """Compresses ppds in independent blocks of block_size bytes.
+
+    Blocks also end at each of the breaks offsets. The codec's dictionary
+    is trained on the PPDs at the (start, length) spans. Returns the
+    Payload of the compressed PPDs, where blocks holds the (start, offset,
+    size) of each block: its start in ppds, and its offset and size in the
+    compressed PPDs. With xz, each block is a complete stream, so the
+    compressed PPDs are still a valid (multi-stream) xz file. Blocks are
+    compressed by a pool of jobs threads (see compress_stream()), but the
+    Payload is the same whatever the number of jobs.
+    """
+    codec = pyppd.compressor.get_codec(codec)
+    dictionary = codec.train(dictionary_samples(ppds, spans))
+    blocks = ((start, ppds[start:end]) for start, end
+              in block_spans(len(ppds), block_size, breaks))
+    ppds_blocks, ppds_compressed = compress_stream(codec, dictionary, blocks,
+                                                   jobs=jobs)
+    return Payload(codec.name, dictionary, ppds_blocks, ppds_compressed)
+
+def compress_stream(codec, dictionary, blocks, output=None, jobs=None):
+    """Compresses the (start, data) blocks with a pool of jobs threads.
 
+    Compression is done concurrently (the codecs release the GIL), but the
+    blocks are kept in order. Returns a (ppds_blocks, ppds_compressed)
+    tuple as in Payload; when output is given, the compressed blocks are
+    written to it as they come and ppds_compressed is None.
+    """
+    def compress_block(start, data):
+        return start, codec.compress(data, dictionary)
+
+    ppds_blocks = []
+    ppds_compressed = bytearray()
+    offset = 0
+    for start, block in ordered_map(compress_block, blocks, jobs):
+        ppds_blocks.append((start, offset, len(block)))
+        offset += len(block)
+        if output is None:
+            ppds_compressed.extend(block)
+        else:
+            output.write(block)
+    if output is not None:
+        return ppds_blocks, None
+    return ppds_blocks, bytes(ppds_compressed)
+
+def ordered_map(function, iterable, jobs=None, executor=ThreadPoolExecutor):
+    """Yields function(*args) for each args of iterable, in order.
+
+    The calls are made by a pool of jobs workers (one per CPU by default),
+    threads unless another Executor class is given, e.g. a
+    ProcessPoolExecutor for calls which hold the GIL. Unlike
+    Executor.map(), iterable is consumed as results are, so only a few
+    items per worker are held in memory at once.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    with executor(jobs) as executor:
+        pending = deque()
+        for args in iterable:
+            pending.append(executor.submit(function, *args))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def block_spans(length, block_size, breaks=()):
+    """Yields the (start, end) of blocks of block_size bytes at most.
+
+    Blocks also end at each of the breaks offsets.
+    """
+    start = 0
+    for end in sorted(set(breaks) | {length}):
+        for block_start in range(start, end, block_size):
+            yield block_start, min(block_start + block_size, end)
+        start = end
+
+def stream_blocks(ppds, block_size):
+    """Yields the (start, data) blocks of the (ppd_chunk, ends_block) ppds.
+
+    The blocks are cut as block_spans() does, but without holding more
+    than a block in memory.
+    """
+    start = 0
+    block = bytearray()
+    for ppd_chunk, ends_block in ppds:
+        block.extend(ppd_chunk)
+        while len(block) >= block_size:
+            yield start, bytes(block[:block_size])
+            del block[:block_size]
+            start += block_size
+        if ends_block and block:
+            yield start, bytes(block)
+            start += len(block)
+            block = bytearray()
+    if block:
+        yield start, bytes(block)
+
+def read_weights(path):
+    """Returns how often each PPD is requested, read from the file at path.
+
+    Each line holds a PPD URI, as listed by the archive and given to "cat",
+    optionally followed by its weight (1 by default), so the access log of
+    an archive (see PYPPD_ACCESS_LOG in pyppd-ppdfile.in) can be used as
+    is. Returns a dict mapping PPD filenames to their total weight.
+    """
+    weights = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            uri, _, weight = line.rpartition(" ")
+            try:
+                weight = float(weight)
+            except ValueError:
+                uri, weight = line, 1
+            # Same as "cat": ignore driver's name and the entry's number
+            filename = uri.strip().split(":")[-1]
+            filename = filename[filename.find("/") + 1:]
+            weights[filename] = weights.get(filename, 0) + weight
+    return weights
+
+def hottest(filenames, weights, hot=HOT_PPDS):
+    """Returns the hot filenames with the biggest weights, heaviest first."""
+    filenames = [filename for filename in filenames
+                 if weights.get(filename, 0) > 0]
+    filenames.sort(key=lambda filename: (-weights[filename], filename))
+    return filenames[:hot]
+
+def dictionary_samples(ppds, spans, size=DICTIONARY_SAMPLES_SIZE):
+    """Returns PPDs at the (start, length) spans, evenly picked up to size."""
+    spans = list(spans)
+    total = sum(length for start, length in spans)
+    step = max(1, -(-total // size))
+    return [memoryview(ppds)[start:start + length]
+            for start, length in spans[::step]]
+
+def find_ppds(directory):
+    """Yields the (path, filename) of the PPDs in directory, sorted by path.
+
+    filename is the path relative to directory, without the .gz extension
+    of gzipped PPDs, as the PPD is named in the archive.
+    """
+    abs_directory = Path(directory).absolute()
     for ppd_path in sorted(find_files(directory, ("*.ppd", "*.ppd.gz"))):
         ppd_filename = str(ppd_path.relative_to(abs_directory))
-
         # Handle gzipped PPDs
         if ppd_path.suffix.lower() == '.gz':
-            with gzip.open(ppd_path, 'rb') as f:
-                ppd_file = f.read()
             ppd_filename = ppd_filename[:-3]  # Remove .gz extension
-        else:
-            with ppd_path.open('rb') as f:
-                ppd_file = f.read()
-
-        start = len(ppds)
-        length = len(ppd_file)
-        logging.debug(f'Found {ppd_path} ({length} bytes)')
-
-        # Parse PPD and add to index
-        ppd_parsed = pyppd.ppd.parse(ppd_file, ppd_filename)
-        ppd_descriptions = [str(p) for p in ppd_parsed]
-        
-        for p in ppd_parsed:
-            ppds_index[p.uri] = (start, length, ppd_descriptions)
-        
-        ppds.extend(ppd_file)
-
-    if not ppds:
-        logging.error(f'No PPDs found in directory: {directory}')
-        return None
-
-    # Compress and encode archive
-    ppds_index['ARCHIVE'] = base64.b64encode(
-        pyppd.compressor.compress(ppds)
-    ).decode('ascii')
-    
-    return pyppd.compressor.compress(
-        json.dumps(ppds_index, ensure_ascii=True, sort_keys=True).encode('utf-8')
-    )
+        yield ppd_path, ppd_filename
 
 def find_files(directory, patterns):
     """Yield files matching patterns in directory hierarchy."""
@@ -0,0 +1,70 @@
+import os
+import logging
+import marshal
+import zipfile
+
+import pyppd.archiver
+
+# Where "pyppd index-drivers" writes the catalog and the archives look for
+# it, unless the PYPPD_CATALOG environment variable names another file.
+# pyppd-ppdfile.in has its own copy.
+CATALOG = "/var/cache/pyppd/catalog"
+# Where CUPS looks for its drivers
+DRIVERS = "/usr/lib/cups/driver"
+# Start of the catalogs, followed by the size of their header
+MAGIC = b"pyppd-catalog 1\n"
+
+def path():
+    """Returns the path of the catalog."""
+    return os.environ.get("PYPPD_CATALOG") or CATALOG
+
+def build(directory=DRIVERS):
+    """Returns the catalog of the archives in directory.
+
+    The catalog holds the "list" output of every archive generated by
+    pyppd in directory, keyed by the digest of the archive's contents
+    stored at build time: an archive answers "list" from the catalog when
+    it holds its digest, i.e. when the catalog is as recent as the archive,
+    reading one file instead of inflating its own list.
+
+    The catalog starts with MAGIC, the 4 bytes little-endian size of its
+    header, and its header: the marshalled dict mapping each digest to the
+    (offset, length) of its list after the header. The lists follow,
+    uncompressed, so an archive only reads its own.
+    """
+    lists = {}
+    for name in sorted(os.listdir(directory)):
+        archive_path = os.path.join(directory, name)
+        if not os.path.isfile(archive_path):
+            continue
+        try:
+            with zipfile.ZipFile(archive_path) as z:
+                digest = z.read("digest")
+                ppds_list = z.read("list")
+        except (zipfile.BadZipFile, KeyError, OSError):
+            # Another driver, or an archive too old to have a digest
+            logging.info(f'Skipping "{archive_path}", not an archive '
+                         f'generated by this pyppd')
+            continue
+        logging.info(f'Adding "{archive_path}"')
+        lists[digest] = ppds_list
+
+    header = {}
+    offset = 0
+    for digest, ppds_list in sorted(lists.items()):
+        header[digest] = (offset, len(ppds_list))
+        offset += len(ppds_list)
+    header = marshal.dumps(header, pyppd.archiver.MARSHAL_VERSION)
+    return b"".join([MAGIC, len(header).to_bytes(4, "little"), header] +
+                    [ppds_list for digest, ppds_list in sorted(lists.items())])
+
+def read(catalog):
+    """Returns the dict mapping digests to lists of the catalog's bytes."""
+    if not catalog.startswith(MAGIC):
+        raise ValueError("Not a pyppd catalog")
+    start = len(MAGIC) + 4
+    size = int.from_bytes(catalog[len(MAGIC):start], "little")
+    header = marshal.loads(catalog[start:start + size])
+    start += size
+    return {digest: catalog[start + offset:start + offset + length]
+            for digest, (offset, length) in header.items()}
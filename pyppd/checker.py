@@ -0,0 +1,103 @@
+import zlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pyppd.archiver
+import pyppd.ppd
+
+# Number of PPDs each process of check() is handed at once, which keeps
+# the cost of passing them around small
+BATCH_SIZE = 64
+# The lists of problems of a report, see check()
+PROBLEMS = ("errors", "unknown_languages", "missing_keywords",
+            "duplicate_uris", "deviceid_collisions")
+
+def check(directory, jobs=None):
+    """Checks the PPDs in directory, as they would be archived.
+
+    Every PPD is read and parsed by a pool of jobs processes, as parsing
+    holds the GIL, in batches of BATCH_SIZE PPDs, going on past the ones
+    which fail. Returns a report dict, ready to be dumped as JSON,
+    counting the PPDs found and the entries they give, and listing each
+    kind of problem (see PROBLEMS):
+
+    errors: the PPDs which can't be read or parsed, as {file, error}.
+    unknown_languages: *LanguageVersion values which aren't in
+        pyppd.ppd.LANGUAGES, as {file, language}.
+    missing_keywords: *LanguageVersion, *Manufacturer or *NickName
+        missing from a PPD, as {file, keyword}.
+    duplicate_uris: the PPDs archived under the same URI (e.g. both
+        gzipped and not), as {filename, files}.
+    deviceid_collisions: the 1284 Device IDs given by the entries of
+        different PPDs, as {deviceid, uris}: CUPS can't tell them apart.
+
+    Files are relative to directory.
+    """
+    abs_directory = Path(directory).absolute()
+    ppd_paths = list(pyppd.archiver.find_ppds(directory))
+    batches = [(ppd_paths[start:start + BATCH_SIZE],)
+               for start in range(0, len(ppd_paths), BATCH_SIZE)]
+
+    report = {"ppds": len(ppd_paths), "entries": 0}
+    for problem in PROBLEMS:
+        report[problem] = []
+    files = {}
+    deviceids = {}
+    checked = (checked_ppd for checked_batch in
+               pyppd.archiver.ordered_map(check_ppds, batches, jobs,
+                                          ProcessPoolExecutor)
+               for checked_ppd in checked_batch)
+    for ppd_path, ppd_filename, ppd_entries, problems in checked:
+        ppd_file = str(ppd_path.relative_to(abs_directory))
+        logging.debug(f'Checked {ppd_file}')
+        files.setdefault(ppd_filename, []).append(ppd_file)
+        for keyword, value in problems:
+            if keyword is None:
+                report["errors"].append({"file": ppd_file, "error": value})
+            elif value is None:
+                report["missing_keywords"].append({"file": ppd_file,
+                                                   "keyword": keyword})
+            else:
+                report["unknown_languages"].append({"file": ppd_file,
+                                                    "language": value})
+        report["entries"] += len(ppd_entries)
+        for uri, deviceid in ppd_entries:
+            deviceids.setdefault(deviceid.strip().rstrip(";").lower(),
+                                 []).append((ppd_filename, uri, deviceid))
+
+    for ppd_filename, ppd_files in files.items():
+        if len(ppd_files) > 1:
+            report["duplicate_uris"].append({"filename": ppd_filename,
+                                             "files": ppd_files})
+    for entries in deviceids.values():
+        if len(set(ppd_filename for ppd_filename, uri, deviceid
+                   in entries)) > 1:
+            report["deviceid_collisions"].append(
+                {"deviceid": entries[0][2],
+                 "uris": [uri for ppd_filename, uri, deviceid in entries]})
+    return report
+
+def check_ppds(ppd_paths):
+    """Returns the check_ppd() of each of the (path, filename) ppd_paths."""
+    return [check_ppd(ppd_path, ppd_filename)
+            for ppd_path, ppd_filename in ppd_paths]
+
+def check_ppd(ppd_path, ppd_filename):
+    """Returns the (ppd_path, ppd_filename, ppd_entries, problems) of a PPD,
+    for check(): the (uri, deviceid) of its entries, and its problems as in
+    pyppd.ppd.PPDError."""
+    try:
+        ppd_keywords = pyppd.archiver.read_ppd(ppd_path)[1]
+        ppd_entries = [(ppd.uri, ppd.deviceid) for ppd in
+                       pyppd.ppd.parse(ppd_keywords, ppd_filename)]
+    except pyppd.ppd.PPDError as e:
+        return ppd_path, ppd_filename, [], e.problems
+    except (OSError, EOFError, zlib.error) as e:
+        # Unreadable, or badly gzipped
+        return ppd_path, ppd_filename, [], [(None, str(e))]
+    return ppd_path, ppd_filename, ppd_entries, []
+
+def problems(report):
+    """Returns the number of problems in report."""
+    return sum(len(report[problem]) for problem in PROBLEMS)
@@ -1,16 +1,222 @@
-from subprocess import Popen, PIPE
+# This module is also shipped in the generated archives, where "cat" uses
+# the codecs to decompress PPDs: it must only use the standard library, and
+# import anything else (or anything slow to import) lazily.
+
+# Maximum size of the chunks decompress_stream() yields
+CHUNK_SIZE = 64 << 10
 
 def compress(value):
     """Compresses a byte array with the xz binary"""
+    from subprocess import Popen, PIPE
     process = Popen(["xz", "--compress", "--force"], stdin=PIPE, stdout=PIPE)
     return process.communicate(value)[0]
 
 def decompress(value):
     """Decompresses a byte array with the xz binary"""
+    from subprocess import Popen, PIPE
     process = Popen(["xz", "--decompress", "--stdout", "--force"], stdin=PIPE, stdout=PIPE)
     return process.communicate(value)[0]
 
 def compress_file(path):
     """Compress the file at 'path' with the xz binary"""
+    from subprocess import Popen, PIPE
     process = Popen(["xz", "--compress", "--force", "--stdout", path], stdout=PIPE)
     return process.communicate()[0]
+
+
+class CodecError(Exception):
+    """Raised for unknown codecs, or codecs whose module isn't installed."""
+
+
+class Codec(object):
+    """Compresses the blocks of PPDs of an archive.
+
+    Codecs may use a dictionary trained on the PPDs at build time, which is
+    stored in the archive, so that even small blocks compress well.
+    """
+    name = None
+    # Whether train() returns a dictionary
+    uses_dictionary = False
+
+    def check(self):
+        """Raises CodecError if the codec can't be used here."""
+
+    def train(self, samples):
+        """Returns a dictionary trained on the samples, or b"" for none."""
+        return b""
+
+    def compress(self, data, dictionary=b""):
+        raise NotImplementedError
+
+    def decompress(self, data, dictionary=b""):
+        raise NotImplementedError
+
+    def decompress_stream(self, data, dictionary=b"", chunk_size=CHUNK_SIZE):
+        """Yields data decompressed, in chunks of at most chunk_size bytes.
+
+        Codecs which can decompress a bit at a time never hold more than a
+        chunk of the output, and stop decompressing as soon as the caller
+        stops iterating; this fallback decompresses data whole.
+        """
+        data = self.decompress(data, dictionary)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+
+class XZCodec(Codec):
+    """LZMA in xz streams: the best ratio, but slow to decompress."""
+    name = "xz"
+
+    def compress(self, data, dictionary=b""):
+        import lzma
+        return lzma.compress(data)
+
+    def decompress(self, data, dictionary=b""):
+        import lzma
+        return lzma.decompress(data)
+
+    def decompress_stream(self, data, dictionary=b"", chunk_size=CHUNK_SIZE):
+        import lzma
+        decompressor = lzma.LZMADecompressor()
+        while not decompressor.eof:
+            chunk = decompressor.decompress(data, chunk_size)
+            data = b""
+            if chunk:
+                yield chunk
+            elif decompressor.needs_input:
+                raise lzma.LZMAError("Compressed data ended before the "
+                                     "end-of-stream marker was reached")
+
+
+class ZlibCodec(Codec):
+    """Deflate with a preset dictionary of the most common lines."""
+    name = "zlib"
+    uses_dictionary = True
+    # Deflate can't look further back than its 32 KiB window
+    dictionary_size = 32768
+
+    def train(self, samples):
+        counts = {}
+        for sample in samples:
+            for line in bytes(sample).splitlines(True):
+                counts[line] = counts.get(line, 0) + 1
+        # Keep the lines saving the most bytes, the best ones last as they
+        # are the cheapest to refer to
+        lines = sorted((line for line, count in counts.items() if count > 1),
+                       key=lambda line: (counts[line] * len(line), line),
+                       reverse=True)
+        dictionary = []
+        size = 0
+        for line in lines:
+            if size + len(line) > self.dictionary_size:
+                continue
+            dictionary.append(line)
+            size += len(line)
+        return b"".join(reversed(dictionary))
+
+    def compress(self, data, dictionary=b""):
+        import zlib
+        if dictionary:
+            compressor = zlib.compressobj(9, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(9)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data, dictionary=b""):
+        import zlib
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def decompress_stream(self, data, dictionary=b"", chunk_size=CHUNK_SIZE):
+        import zlib
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        while data:
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+
+class ZstdCodec(Codec):
+    """Zstandard with a trained dictionary: fast to decompress.
+
+    Needs the zstandard module, when building and running the archive.
+    """
+    name = "zstd"
+    uses_dictionary = True
+    dictionary_size = 112640
+    level = 19
+
+    def check(self):
+        self.module()
+
+    def module(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise CodecError("Codec 'zstd' needs the zstandard module, which "
+                             "isn't installed (the xz and zlib codecs only "
+                             "need the Python standard library)")
+        return zstandard
+
+    def train(self, samples):
+        zstandard = self.module()
+        samples = [bytes(sample) for sample in samples]
+        try:
+            return zstandard.train_dictionary(self.dictionary_size,
+                                              samples).as_bytes()
+        except zstandard.ZstdError:
+            # Not enough samples to train a dictionary
+            return b""
+
+    def compress(self, data, dictionary=b""):
+        zstandard = self.module()
+        if dictionary:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            return zstandard.ZstdCompressor(
+                level=self.level, dict_data=dictionary).compress(data)
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data, dictionary=b""):
+        zstandard = self.module()
+        if dictionary:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            return zstandard.ZstdDecompressor(
+                dict_data=dictionary).decompress(data)
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def decompress_stream(self, data, dictionary=b"", chunk_size=CHUNK_SIZE):
+        zstandard = self.module()
+        if dictionary:
+            dictionary = zstandard.ZstdCompressionDict(dictionary)
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        with decompressor.stream_reader(data) as reader:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+CODECS = {codec.name: codec for codec in (XZCodec, ZlibCodec, ZstdCodec)}
+
+def get_codec(name):
+    """Returns the codec called name, checking that it can be used."""
+    try:
+        codec = CODECS[name]()
+    except KeyError:
+        raise CodecError("Unknown codec '%s' (available: %s)" %
+                         (name, ", ".join(sorted(CODECS))))
+    codec.check()
+    return codec
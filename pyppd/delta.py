@@ -0,0 +1,134 @@
+# This module is also shipped in the generated archives, where "cat" uses
+# apply() to rebuild the PPDs stored as deltas: it must only use the
+# standard library, and import anything else (or anything slow to import)
+# lazily.
+
+# Number of line hashes kept in the sketch of a PPD
+SKETCH_SIZE = 64
+# Minimum estimated similarity (the Jaccard index of their lines) for a PPD
+# to be stored as a delta of a base
+SIMILARITY = 0.5
+# Number of bases sharing the most hashes with a PPD compared to it
+CANDIDATES = 8
+# Hashes shared by more bases than this tell too little to look them up
+MAX_SHARING = 256
+# Single lines shorter than this are cheaper stored than copied from base
+MIN_COPY = 16
+# Deltas bigger than this share of their PPD aren't worth rebuilding it
+MAX_DELTA_RATIO = 0.5
+
+def sketch(ppd):
+    """Returns the MinHash sketch of the lines of ppd.
+
+    It is a bottom-k sketch: the SKETCH_SIZE smallest hashes of its
+    distinct lines, sorted, which only takes one hash function.
+    """
+    from heapq import nsmallest
+    from zlib import crc32
+    return tuple(nsmallest(SKETCH_SIZE, set(map(crc32, ppd.splitlines()))))
+
+def similarity(sketch1, sketch2):
+    """Returns the Jaccard index of two PPDs' lines, estimated from their
+    sketches."""
+    from heapq import nsmallest
+    hashes1 = set(sketch1)
+    hashes2 = set(sketch2)
+    union = nsmallest(SKETCH_SIZE, hashes1 | hashes2)
+    if not union:
+        return 0.0
+    return sum(1 for h in union if h in hashes1 and h in hashes2) / len(union)
+
+def cluster(sketches, threshold=SIMILARITY):
+    """Returns the base of each of sketches, as the index of its sketch.
+
+    Sketches are clustered greedily, in order: each one gets the most
+    similar base seen so far, if any is similar enough, or becomes a base
+    itself (and gets None). Bases are found from the hashes they share with
+    the sketch, so sketches are never all compared with each other.
+    """
+    bases = []
+    sharing = {}
+    for i, hashes in enumerate(sketches):
+        shared = {}
+        for h in hashes:
+            candidates = sharing.get(h, ())
+            if len(candidates) > MAX_SHARING:
+                continue
+            for candidate in candidates:
+                shared[candidate] = shared.get(candidate, 0) + 1
+        base = None
+        best = threshold
+        for candidate in sorted(shared, key=lambda c: (-shared[c], c))[
+                :CANDIDATES]:
+            score = similarity(hashes, sketches[candidate])
+            if score >= best:
+                base, best = candidate, score
+        bases.append(base)
+        if base is None:
+            for h in hashes:
+                sharing.setdefault(h, []).append(i)
+    return bases
+
+def encode(base, ppd):
+    """Returns the line-level delta rebuilding ppd from base.
+
+    The delta is a marshalled list of operations: a (start, end) tuple
+    copies base's lines start to end, and bytes are inserted as they are.
+    Runs of lines are found through the first line of base equal to each
+    line of ppd, in one pass, so lines moved around are also copied.
+    """
+    from marshal import dumps
+    base_lines = base.splitlines(True)
+    lines = ppd.splitlines(True)
+    first = {}
+    for j, line in enumerate(base_lines):
+        first.setdefault(line, j)
+
+    operations = []
+    inserted = []
+    i = 0
+    expected = 0
+    while i < len(lines):
+        line = lines[i]
+        # Prefer going on where the last run stopped
+        if expected < len(base_lines) and base_lines[expected] == line:
+            j = expected
+        else:
+            j = first.get(line)
+        if j is None:
+            inserted.append(line)
+            i += 1
+            continue
+        run = 1
+        while (i + run < len(lines) and j + run < len(base_lines) and
+               base_lines[j + run] == lines[i + run]):
+            run += 1
+        if run == 1 and len(line) < MIN_COPY:
+            inserted.append(line)
+            i += 1
+            expected = j + 1
+            continue
+        if inserted:
+            operations.append(b"".join(inserted))
+            inserted = []
+        operations.append((j, j + run))
+        i += run
+        expected = j + run
+    if inserted:
+        operations.append(b"".join(inserted))
+    return dumps(operations, 2)
+
+def apply(base, delta):
+    """Returns the PPD rebuilt from base and its delta (see encode())."""
+    return b"".join(rebuild(base, delta))
+
+def rebuild(base, delta):
+    """Yields the PPD rebuilt from base and its delta, an operation at a
+    time."""
+    from marshal import loads
+    base_lines = base.splitlines(True)
+    for operation in loads(delta):
+        if isinstance(operation, tuple):
+            yield b"".join(base_lines[operation[0]:operation[1]])
+        else:
+            yield operation
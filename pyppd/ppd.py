@@ -50,6 +50,130 @@ LANGUAGES = {'afar': 'aa', 'abkhazian': 'ab', 'afrikaans': 'af',
              'simplified chinese': 'zh_TW', 'traditional chinese': 'zh_CN',
              'zulu': 'zu', 'portuguese_brazil': 'pt_BR'}
 
+# The keywords parse() looks for
+KEYWORDS_RE = re.compile(rb'\*(?:LanguageVersion|Manufacturer|NickName|'
+                         rb'ModelName|1284DeviceID|Product):')
+# The values of the keywords parse() looks for
+LANGUAGEVERSION_RE = re.compile(rb'\*LanguageVersion:\s*(.+)')
+MANUFACTURER_RE = re.compile(rb'\*Manufacturer:\s*"(.+)"')
+NICKNAME_RE = re.compile(rb'\*NickName:\s*"(.+)"')
+MODELNAME_RE = re.compile(rb'\*ModelName:\s*"(.+)"')
+DEVICEID_RE = re.compile(rb'\*1284DeviceID:\s*"(.+)"')
+PRODUCT_RE = re.compile(rb'\*Product:\s*"\(\s*(.+?)\s*\)"')
+# The names of the 1284 Device ID fields parse() looks for (see field())
+DRV_FIELD_RE = re.compile(r'DRV:', re.I)
+MODEL_FIELD_RE = re.compile(r'MODEL:|MDL:', re.I)
+# Number of non-blank lines a keyword's value may span, as parse() matches
+# it: the one starting it (e.g. *Product: "(), the one holding it and the
+# one closing it (e.g. )")
+KEYWORD_LINES = 3
+
+
+class KeywordScanner(object):
+    """Keeps the lines of a PPD parse() looks at, as it is fed in chunks.
+
+    parse() gives the same results for the lines kept as for the whole PPD:
+    they are the lines holding a keyword it looks for, with the lines its
+    value may span. Other lines (most of the PPD) are dropped, so a PPD
+    can be parsed without ever being held whole.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.partial = b""
+        # Non-blank lines left in the value of the last keyword
+        self.remaining = 0
+
+    def feed(self, chunk):
+        last = chunk.rfind(b"\n") + 1
+        if not last:
+            self.partial += chunk
+            return
+        first = chunk.find(b"\n") + 1
+        if self.partial:
+            self.scan(self.partial + chunk[:first])
+        else:
+            first = 0
+        self.scan(chunk, first, last)
+        self.partial = chunk[last:]
+
+    def close(self):
+        """Returns the lines kept, once fed the whole PPD."""
+        if self.partial:
+            self.scan(self.partial)
+            self.partial = b""
+        return b"".join(self.lines)
+
+    def scan(self, data, pos=0, endpos=None):
+        """Keeps the lines of data[pos:endpos] which parse() looks at."""
+        if endpos is None:
+            endpos = len(data)
+        while pos < endpos:
+            if self.remaining == 0:
+                # Skip to the next line holding a keyword
+                keyword = KEYWORDS_RE.search(data, pos, endpos)
+                if keyword is None:
+                    return
+                pos = data.rfind(b"\n", pos, keyword.start()) + 1 or pos
+            end = data.find(b"\n", pos, endpos) + 1 or endpos
+            line = data[pos:end]
+            pos = end
+            keyword = None
+            for keyword in KEYWORDS_RE.finditer(line):
+                pass
+            if keyword is not None:
+                self.lines.append(line)
+                self.remaining = KEYWORD_LINES
+                if line[keyword.end():].strip():
+                    self.remaining -= 1
+            elif self.remaining > 0:
+                self.lines.append(line)
+                if line.strip():
+                    self.remaining -= 1
+
+
+class PPDError(Exception):
+    """Raised by parse() for PPDs which can't be indexed.
+
+    problems lists (keyword, value) tuples: a keyword missing from the PPD
+    has a None value, and an unknown *LanguageVersion its value. Any other
+    error has a None keyword and its message as value.
+    """
+
+    def __init__(self, filename, problems):
+        self.filename = filename
+        self.problems = problems
+        super().__init__("Error parsing PPD file '%s': %s" %
+                         (filename, ", ".join(describe(keyword, value)
+                                              for keyword, value in problems)))
+
+
+def describe(keyword, value):
+    if keyword is None:
+        return value
+    if value is None:
+        return "no *%s" % keyword
+    return "unknown *%s '%s'" % (keyword, value)
+
+
+def field(deviceid, name_re):
+    """Returns the value of the last field of deviceid named by name_re.
+
+    The value runs from the name to the next ";", stripped. Returns None if
+    there is no such field. Names are looked for anywhere in deviceid, not
+    only at the start of a field, as parse() always did: the last one wins.
+    """
+    # Only the names followed by a ";" have a value
+    end = deviceid.rfind(";")
+    name = None
+    for name in name_re.finditer(deviceid, 0, max(end, 0)):
+        pass
+    if name is None:
+        return None
+    end = deviceid.find(";", name.end())
+    return deviceid[name.end():end].strip()
+
+
 class PPD(object):
     """Represents a PostScript Description file."""
     def __init__(self, uri, language, manufacturer, nickname, deviceid):
@@ -71,26 +195,41 @@ def parse(ppd_file, filename):
 
     One ppd_file might result in more than one PPD. The rules are: return an
     PPD for each "1284DeviceID" entry, and one for each "Product" line, if it
-    creates an unique (Manufacturer, Product) DeviceID.
+    creates an unique (Manufacturer, Product) DeviceID. Raises PPDError if
+    ppd_file lacks what the entries need.
     """
 
     def standardize(model_name):
         # Consider it the same model if the product name differs only by
         # upper/lower case and by the presence/absence of the manufacturer
         # name
-        return model_name.lower().replace("Hewlett-Packard ".lower(), "").replace("%s " % manufacturer.lower(), "").strip()
+        return model_name.lower().replace("hewlett-packard ", "").replace(manufacturer_prefix, "").strip()
+
+    logging.debug('Parsing %s.', filename)
+    language_re     = LANGUAGEVERSION_RE.search(ppd_file)
+    manufacturer_re = MANUFACTURER_RE.search(ppd_file)
+    nickname_re     = NICKNAME_RE.search(ppd_file)
+    modelname_re    = MODELNAME_RE.search(ppd_file)
+    deviceids       = DEVICEID_RE.findall(ppd_file)
 
-    logging.debug('Parsing %s.' % filename)
-    # Fix escape sequences by using raw byte strings (rb)
-    language_re     = re.search(rb'\*LanguageVersion:\s*(.+)', ppd_file)
-    manufacturer_re = re.search(rb'\*Manufacturer:\s*"(.+)"', ppd_file)
-    nickname_re     = re.search(rb'\*NickName:\s*"(.+)"', ppd_file)
-    modelname_re    = re.search(rb'\*ModelName:\s*"(.+)"', ppd_file)
-    deviceids       = re.findall(rb'\*1284DeviceID:\s*"(.+)"', ppd_file)
+    problems = []
+    if language_re is None:
+        problems.append(('LanguageVersion', None))
+    else:
+        language = language_re.group(1).decode('UTF-8', errors='replace').strip()
+        if language.lower() not in LANGUAGES:
+            problems.append(('LanguageVersion', language))
+    if manufacturer_re is None:
+        problems.append(('Manufacturer', None))
+    if nickname_re is None:
+        problems.append(('NickName', None))
+    if problems:
+        raise PPDError(filename, problems)
 
     try:
-        language = LANGUAGES[language_re.group(1).decode('UTF-8', errors='replace').strip().lower()]
+        language = LANGUAGES[language.lower()]
         manufacturer = manufacturer_re.group(1).strip().decode('UTF-8', errors='replace')
+        manufacturer_prefix = "%s " % manufacturer.lower()
         nickname = nickname_re.group(1).strip().decode('UTF-8', errors='replace')
         if modelname_re != None:
             modelname = modelname_re.group(1).strip().decode('UTF-8', errors='replace')
@@ -99,7 +238,8 @@ def parse(ppd_file, filename):
         logging.debug('Language: "%s", Manufacturer: "%s", Nickname: "%s".' %
                       (language, manufacturer, nickname))
         ppds = []
-        models = []
+        # The standardized models of the entries, as they can be hundreds
+        models = set()
         drventry = None
         line = 0
         num_device_ids = 0
@@ -108,40 +248,35 @@ def parse(ppd_file, filename):
         if deviceids:
             for deviceid in deviceids:
                 deviceid = deviceid.decode('UTF-8', errors='replace')
-                logging.debug('1284DeviceID: "%s".' % deviceid)
+                logging.debug('1284DeviceID: "%s".', deviceid)
                 if (not deviceid.endswith(";")):
                     deviceid += ";"
                 uri = "%d/%s" % (line, filename)
                 # Save a DRV field (from Foomatic) and use it for all entries
                 # of this PPD
-                # Fix escape sequences by using raw strings (r)
-                newdrventry = re.findall(r".*DRV:\s*(.*?)\s*;.*", deviceid, re.I)
-                if (len(newdrventry) > 0):
-                    drventry = newdrventry[0]
+                newdrventry = field(deviceid, DRV_FIELD_RE)
+                if (newdrventry is not None):
+                    drventry = newdrventry
                 elif (drventry != None):
                     deviceid += "DRV:%s;" % drventry
-                # Fix escape sequences by using raw strings (r)
-                newmodels = re.findall(r".*(?:MODEL|MDL):\s*(.*?)\s*;.*", deviceid, re.I)
-                if (newmodels):
-                    newmodels = list(map(standardize, newmodels))
-                if (len(newmodels) > 0):
+                newmodel = field(deviceid, MODEL_FIELD_RE)
+                if (newmodel is not None):
                     # Consider only IDs with a MODEL/MDL field
-                    ppds += [PPD(uri, language, manufacturer, nickname, deviceid.strip())]
-                    models += newmodels
+                    ppds.append(PPD(uri, language, manufacturer, nickname, deviceid.strip()))
+                    models.add(standardize(newmodel))
                     num_device_ids += 1
                     line += 1
 
-        # Fix escape sequences by using raw byte strings (rb)
-        for product in re.findall(rb'\*Product:\s*"\(\s*(.+?)\s*\)"', ppd_file):
+        for product in PRODUCT_RE.findall(ppd_file):
             num_products += 1
             product = product.strip().decode('UTF-8', errors='replace')
 
             # Don't add a new entry if there's already one for the same
             # product/model
             product_standardized = standardize(product)
-            logging.debug('Product: "%s"' % product)
+            logging.debug('Product: "%s"', product)
             if product_standardized in models:
-                logging.debug('Ignoring already found *Product: "%s".' %
+                logging.debug('Ignoring already found *Product: "%s".',
                               product)
                 continue
 
@@ -149,10 +284,10 @@ def parse(ppd_file, filename):
             if (drventry != None):
                 deviceid += "DRV:%s;" % drventry
             uri = "%d/%s" % (line, filename)
-            ppds += [PPD(uri, language, manufacturer, nickname, deviceid)]
+            ppds.append(PPD(uri, language, manufacturer, nickname, deviceid))
             line += 1
             product_added = True
-            models += [product_standardized]
+            models.add(product_standardized)
 
         # Note that we do not consider the ModelName if it contains
         # "BR-Script" here, as in PPD files for Brother BR-Script printers
@@ -180,5 +315,5 @@ def parse(ppd_file, filename):
             logging.info('WARNING: No index entry generated for %s' % filename)
 
         return ppds
-    except:
-        raise Exception("Error parsing PPD file '%s'" % filename)
\ No newline at end of file
+    except Exception as e:
+        raise PPDError(filename, [(None, str(e))]) from e
\ No newline at end of file
@@ -0,0 +1,258 @@
+import os
+import re
+import mmap
+import marshal
+import zipfile
+import asyncio
+import weakref
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pyppd.compressor
+import pyppd.delta
+import pyppd.ppd
+
+# Maximum size of the decompressed blocks kept in memory by an Archive
+CACHE_SIZE = 64 << 20
+
+# A line of the "list" output, as stored in archives (without its opening
+# quote, see pyppd.archiver.list_text())
+LIST_LINE_RE = re.compile(r'(.*?)" (\S+) "(.*?)" "(.*)" "(.*?)"$')
+
+
+class ArchiveError(Exception):
+    """Raised for files which aren't archives this reader can read."""
+
+
+class Archive(object):
+    """Reads the PPDs of an archive generated by pyppd, in process.
+
+    The archive is mapped in memory, and the blocks decompressed to get
+    PPDs are kept in a LRU cache of cache_size bytes. An Archive can be
+    shared by threads, which wait for each other rather than decompressing
+    the same block twice.
+
+    The coroutines aget() and aiter_ppds() decompress in a pool of jobs
+    threads (the codecs release the GIL), at most max_pending PPDs at once:
+    further requests wait, instead of piling up in the pool's queue.
+    """
+
+    def __init__(self, path, cache_size=CACHE_SIZE, jobs=None,
+                 max_pending=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.jobs
+        self._map = None
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with zipfile.ZipFile(path) as z:
+                self._index = marshal.loads(z.read('index'))
+                self._dictionary = z.read('dictionary')
+                self._list = z.read('list').decode('utf-8')
+            self._codec = pyppd.compressor.get_codec(self._index['codec'])
+        except (zipfile.BadZipFile, KeyError, ValueError, EOFError,
+                TypeError):
+            # Not a zip (or an empty file, which can't be mapped), or a zip
+            # without the members of an archive, or with a corrupt index
+            if self._map is not None:
+                self._map.close()
+            raise ArchiveError("'%s' isn't a pyppd archive, or was generated "
+                               "by an older pyppd (see \"pyppd index\")" %
+                               path)
+        except BaseException:
+            # E.g. CodecError, for zstd without the zstandard module
+            if self._map is not None:
+                self._map.close()
+            raise
+        self._payload_offset = self._index['payload'][0]
+        self._blocks = self._index['blocks']
+        self._block_starts = [block[0] for block in self._blocks]
+        self._entries = None
+        self._cache = OrderedDict()
+        self._cache_used = 0
+        self._decompressing = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        # The semaphore of each running loop, as one only works in its own
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._map.close()
+
+    def __contains__(self, uri):
+        return filename(uri) in self._index['ppds']
+
+    def __len__(self):
+        return len(self._index['ppds'])
+
+    def entries(self):
+        """Returns the PPD entries listed by the archive, as PPD objects."""
+        if self._entries is None:
+            entries = []
+            for line in self._list.split('\n') if self._list else []:
+                match = LIST_LINE_RE.match(line)
+                if match:
+                    entries.append(pyppd.ppd.PPD(*match.groups()))
+            self._entries = entries
+        return self._entries
+
+    def find(self, **fields):
+        """Returns the entries whose fields contain the given values.
+
+        Fields are PPD attributes (uri, language, manufacturer, nickname,
+        deviceid), compared case-insensitively, as in
+        find(manufacturer="hp", deviceid="MDL:LaserJet 4;").
+        """
+        fields = [(name, value.lower()) for name, value in fields.items()]
+        return [entry for entry in self.entries()
+                if all(value in getattr(entry, name).lower()
+                       for name, value in fields)]
+
+    def get(self, uri):
+        """Returns the PPD at uri, as given to the archive's "cat".
+
+        Raises KeyError if the archive has no such PPD.
+        """
+        return self._read_entry(self._index['ppds'][filename(uri)])
+
+    def get_many(self, uris):
+        """Returns a dict mapping each of uris to its PPD.
+
+        PPDs are read in archive order, keeping the last block read, so
+        blocks holding several of them are only decompressed once, even if
+        they don't fit in the cache (except for the bases of PPDs stored as
+        deltas, which may be in other blocks).
+        """
+        entries = sorted((self._index['ppds'][filename(uri)], uri)
+                         for uri in uris)
+        last = {}
+        return {uri: self._read_entry(entry, last) for entry, uri in entries}
+
+    def iter_ppds(self):
+        """Yields the (filename, PPD) of every PPD, in archive order.
+
+        Blocks are decompressed once, as in get_many().
+        """
+        ppds = sorted(self._index['ppds'].items(), key=lambda ppd: ppd[1])
+        last = {}
+        for ppd_filename, entry in ppds:
+            yield ppd_filename, self._read_entry(entry, last)
+
+    async def aget(self, uri):
+        """Returns the PPD at uri, like get(), without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.jobs)
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_pending)
+                self._semaphores[loop] = semaphore
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, self.get, uri)
+
+    async def aiter_ppds(self, uris):
+        """Yields the (uri, PPD) of each of uris, in order.
+
+        The next PPDs are read ahead while the caller handles the current
+        one, but no more than max_pending of them.
+        """
+        pending = deque()
+        try:
+            for uri in uris:
+                pending.append((uri, asyncio.ensure_future(self.aget(uri))))
+                if len(pending) >= self.max_pending:
+                    uri, ppd = pending.popleft()
+                    yield uri, await ppd
+            while pending:
+                uri, ppd = pending.popleft()
+                yield uri, await ppd
+        finally:
+            for uri, ppd in pending:
+                ppd.cancel()
+
+    def _read_entry(self, entry, last=None):
+        ppd = self._read(entry[0], entry[1], last)
+        if len(entry) == 3:
+            # The PPD is stored as a delta from a base PPD
+            base = self._index['ppds'][entry[2]]
+            ppd = pyppd.delta.apply(self._read(base[0], base[1], last), ppd)
+        return ppd
+
+    def _read(self, start, length, last=None):
+        # last, when given, maps the last block read to its text: it is
+        # reused, and updated, whether the cache kept the block or not
+        block = bisect_right(self._block_starts, start) - 1
+        ppd = bytearray()
+        while length > 0:
+            block_start = self._blocks[block][0]
+            if last is not None and block in last:
+                text = last[block]
+            else:
+                text = self._block(block)
+                if last is not None:
+                    last.clear()
+                    last[block] = text
+            text = text[start - block_start:start - block_start + length]
+            ppd.extend(text)
+            start += len(text)
+            length -= len(text)
+            block += 1
+        return bytes(ppd)
+
+    def _block(self, block):
+        """Returns the decompressed block, from the cache if possible."""
+        with self._lock:
+            text = self._cache.get(block)
+            if text is not None:
+                self._cache.move_to_end(block)
+                return text
+            # Another thread is already decompressing this block
+            decompressing = self._decompressing.get(block)
+            if decompressing is None:
+                self._decompressing[block] = Future()
+        if decompressing is not None:
+            return decompressing.result()
+
+        # Decompress without holding the lock, so threads can decompress
+        # different blocks at once
+        try:
+            block_start, offset, size = self._blocks[block]
+            offset += self._payload_offset
+            text = self._codec.decompress(self._map[offset:offset + size],
+                                          self._dictionary)
+        except BaseException as e:
+            with self._lock:
+                decompressing = self._decompressing.pop(block)
+            decompressing.set_exception(e)
+            raise
+
+        with self._lock:
+            decompressing = self._decompressing.pop(block)
+            self._cache[block] = text
+            self._cache_used += len(text)
+            while self._cache_used > self.cache_size and self._cache:
+                evicted = self._cache.popitem(last=False)[1]
+                self._cache_used -= len(evicted)
+        decompressing.set_result(text)
+        return text
+
+
+def filename(uri):
+    """Returns the filename of the PPD at uri, as "cat" finds it."""
+    # Ignore driver's name, take only PPD's
+    uri = uri.split(":")[-1]
+    # Remove also the index
+    return uri[uri.find("/") + 1:]
@@ -1,13 +1,19 @@
 import os
-import stat
 import errno
+import json
 import logging
 import sys
 from optparse import OptionParser
 import pyppd.archiver
+import pyppd.catalog
+import pyppd.checker
+import pyppd.compressor
 
-def parse_args():
-    usage = "usage: %prog [options] ppds_directory"
+def option_parser():
+    usage = "usage: %prog [options] ppds_directory\n" \
+            "       %prog [options] index ARCHIVE\n" \
+            "       %prog [options] check ppds_directory\n" \
+            "       %prog [options] index-drivers [DRIVERS_DIRECTORY]"
     version = "%prog 1.1.1\n" \
               "Copyright (c) 2013 Vitor Baptista.\n" \
               "This is free software; see the source for copying conditions.\n" \
@@ -18,14 +24,102 @@ def parse_args():
                       action="count", dest="verbosity", default=0,
                       help="Increase verbosity level (up to -vv for debug)")
     parser.add_option("-o", "--output",
-                      default="pyppd-ppdfile", metavar="FILE",
-                      help="Write archive to FILE [default: %default]")
+                      metavar="FILE",
+                      help="Write archive to FILE [default: pyppd-ppdfile, "
+                           "or ARCHIVE itself for index], the report of "
+                           "check [default: standard output], or the "
+                           "catalog of index-drivers [default: "
+                           "$PYPPD_CATALOG, or " + pyppd.catalog.CATALOG +
+                           "]")
+    parser.add_option("-b", "--block-size",
+                      type="int", default=pyppd.archiver.BLOCK_SIZE,
+                      metavar="BYTES",
+                      help="Compress PPDs in independent blocks of BYTES, "
+                           "the smaller the faster to extract "
+                           "[default: %default]")
+    parser.add_option("-c", "--codec",
+                      type="choice", default=pyppd.archiver.CODEC,
+                      choices=sorted(pyppd.compressor.CODECS),
+                      help="Compress PPDs with CODEC: " +
+                           ", ".join(sorted(pyppd.compressor.CODECS)) +
+                           " [default: %default]")
+    parser.add_option("-w", "--weights",
+                      metavar="FILE",
+                      help="Put the PPDs most requested according to FILE "
+                           "first, each in its own block. FILE holds one URI "
+                           "per line, optionally followed by its weight, as "
+                           "in the archives' PYPPD_ACCESS_LOG")
+    parser.add_option("--hot",
+                      type="int", default=pyppd.archiver.HOT_PPDS,
+                      metavar="COUNT",
+                      help="Number of most requested PPDs put in their own "
+                           "block with --weights [default: %default]")
+    parser.add_option("--delta",
+                      action="store_true", default=False,
+                      help="Store PPDs similar to another one as the "
+                           "difference of their lines with it")
+    parser.add_option("--order",
+                      type="choice", default=pyppd.archiver.ORDER,
+                      choices=pyppd.archiver.ORDERS,
+                      help="Put PPDs in the archive by name, or by "
+                           "similarity: grouped by manufacturer and "
+                           "driver, similar PPDs together. The URIs stay "
+                           "the same [default: %default]")
+    parser.add_option("-j", "--jobs",
+                      type="int", metavar="JOBS",
+                      help="Read, parse and compress PPDs with JOBS "
+                           "threads (processes for check), the archive "
+                           "being the same whatever their number "
+                           "[default: one per CPU]")
+    return parser
+
+def parse_args():
+    parser = option_parser()
     (options, args) = parser.parse_args()
 
+    if options.weights and not os.path.isfile(options.weights):
+        parser.error(f"'{options.weights}' is not a file")
+    try:
+        pyppd.compressor.get_codec(options.codec)
+    except pyppd.compressor.CodecError as e:
+        parser.error(str(e))
+
+    if options.block_size <= 0:
+        parser.error("Block size must be positive")
+    if options.hot < 0:
+        parser.error("Number of hot PPDs must not be negative")
+    if options.jobs is not None and options.jobs <= 0:
+        parser.error("Number of jobs must be positive")
+    if len(args) == 2 and args[0] == "index":
+        # Rebuild an existing archive, in place unless told otherwise
+        if not os.path.isfile(args[1]):
+            parser.error(f"'{args[1]}' is not a file")
+        if options.output is None:
+            options.output = args[1]
+        return (options, args)
+
+    if 1 <= len(args) <= 2 and args[0] == "index-drivers":
+        # Catalog the archives installed for CUPS
+        if len(args) == 1:
+            args.append(pyppd.catalog.DRIVERS)
+        if not os.path.isdir(args[1]):
+            parser.error(f"'{args[1]}' is not a directory")
+        if options.output is None:
+            options.output = pyppd.catalog.path()
+        return (options, args)
+
+    if len(args) == 2 and args[0] == "check":
+        # Only report problems, without building any archive
+        if not os.path.isdir(args[1]):
+            parser.error(f"'{args[1]}' is not a directory")
+        return (options, args)
+
     if len(args) != 1:
         parser.error("Incorrect number of arguments")
     if not os.path.isdir(args[0]):
         parser.error(f"'{args[0]}' is not a directory")
+    if options.output is None:
+        options.output = "pyppd-ppdfile"
 
     return (options, args)
 
@@ -47,19 +141,65 @@ def configure_logging(verbosity):
 def run():
     (options, args) = parse_args()
     configure_logging(options.verbosity)
-    ppds_directory = args[0]
 
-    logging.info(f'Compressing folder "{ppds_directory}"')
-    archive = pyppd.archiver.archive(ppds_directory)
-    if not archive:
-        exit(errno.ENOENT)
+    if args[0] == "check" and len(args) == 2:
+        logging.info(f'Checking folder "{args[1]}"')
+        report = pyppd.checker.check(args[1], options.jobs)
+        text = json.dumps(report, indent=2, ensure_ascii=False) + "\n"
+        if options.output is None:
+            sys.stdout.write(text)
+        else:
+            with open(options.output, "w", encoding="utf-8") as f:
+                f.write(text)
+        # Fail, so builds can be gated on the check
+        if pyppd.checker.problems(report):
+            exit(1)
+        return
+
+    if args[0] == "index-drivers":
+        logging.info(f'Cataloging archives in "{args[1]}"')
+        catalog = pyppd.catalog.build(args[1])
+        logging.info(f'Writing catalog to "{options.output}"')
+        os.makedirs(os.path.dirname(os.path.abspath(options.output)),
+                    exist_ok=True)
+        with pyppd.archiver.replace_file(options.output,
+                                         executable=False) as f:
+            f.write(catalog)
+        return
 
-    logging.info(f'Writing archive to "{options.output}"')
-    with open(options.output, "wb") as f:
-        f.write(archive)
+    weights = None
+    if options.weights:
+        logging.info(f'Reading weights from "{options.weights}"')
+        weights = pyppd.archiver.read_weights(options.weights)
 
-    logging.debug(f'Setting executable permissions on "{options.output}"')
-    os.chmod(options.output, os.stat(options.output).st_mode | stat.S_IEXEC)
+    # The archive is written to a temporary file, renamed to the output
+    # once complete, so a half-written archive is never visible there
+    with pyppd.archiver.replace_file(options.output) as f:
+        if args[0] == "index" and len(args) == 2:
+            logging.info(f'Indexing archive "{args[1]}"')
+            with open(args[1], "rb") as archive:
+                archive = archive.read()
+            try:
+                archive = pyppd.archiver.reindex(archive, options.block_size,
+                                                 options.codec, weights,
+                                                 options.hot, options.delta,
+                                                 options.order, options.jobs)
+            except ValueError:
+                option_parser().error(f"'{args[1]}' is not a pyppd archive")
+            except pyppd.compressor.CodecError as e:
+                # E.g. zstd, without the zstandard module
+                option_parser().error(str(e))
+            logging.info(f'Writing archive to "{options.output}"')
+            f.write(archive)
+        else:
+            ppds_directory = args[0]
+            logging.info(f'Compressing folder "{ppds_directory}"')
+            logging.info(f'Writing archive to "{options.output}"')
+            if not pyppd.archiver.write(f, ppds_directory, options.block_size,
+                                        options.codec, weights, options.hot,
+                                        options.delta, options.order,
+                                        options.jobs):
+                exit(errno.ENOENT)
 
 if __name__ == "__main__":
     run()
@@ -4,8 +4,11 @@ import unittest
 import tempfile
 import os
 import shutil
-import base64
+import io
 import json
+import base64
+import marshal
+import zipfile
 import pyppd.archiver
 import pyppd.compressor
 
@@ -53,32 +56,356 @@ class TestArchiver(unittest.TestCase):
         
         # Check that compression worked
         self.assertIsNotNone(compressed)
+        ppds_index, ppds_list, ppds_payload = compressed
+        
+        # Check that the archive contains our PPDs
+        self.assertEqual(list(ppds_index), ['subdir/test2.ppd', 'test.ppd'])
+        
+        # Check PPD descriptions
+        self.assertEqual(ppds_list,
+                         ['"0/subdir/test2.ppd" en "Test Manufacturer" '
+                          '"Test Printer" "MFG:Test Manufacturer;MDL:Test Model;"',
+                          '"0/test.ppd" en "Test Manufacturer" '
+                          '"Test Printer" "MFG:Test Manufacturer;MDL:Test Model;"'])
         
         # Decompress and check the content
-        decompressed = pyppd.compressor.decompress(compressed)
-        ppds_index = json.loads(decompressed.decode('ASCII'))
+        self.assertEqual(ppds_payload.codec, 'xz')
+        decompressed = pyppd.compressor.decompress(ppds_payload.compressed)
+        start, length = ppds_index['test.ppd']
+        self.assertEqual(decompressed[start:start + length], self.ppd_content)
+    
+    def test_compress_gzipped(self):
+        """Test gzipped PPDs are archived as if they weren't."""
+        import gzip
+        # Big enough to be decompressed in several chunks
+        with open(self.ppd_file, "ab") as f:
+            f.write(b"*% padding\n" * pyppd.archiver.GZIP_CHUNK_SIZE)
+        plain_archive = pyppd.archiver.archive(self.test_dir)
+        for ppd_file in (self.ppd_file, self.ppd_file2):
+            with open(ppd_file, "rb") as f, \
+                    gzip.open(ppd_file + ".gz", "wb") as gz:
+                gz.write(f.read())
+            os.unlink(ppd_file)
+        self.assertEqual(pyppd.archiver.archive(self.test_dir),
+                         plain_archive)
+    
+    def test_compress_blocks(self):
+        """Test that blocks are compressed independently."""
+        ppds = bytes(range(256)) * 10
+        ppds_payload = pyppd.archiver.compress_blocks(ppds, 1000)
         
-        # Check that the archive contains our PPDs
-        self.assertIn('ARCHIVE', ppds_index)
-        self.assertEqual(len(ppds_index) - 1, 2)  # -1 for the ARCHIVE key
+        self.assertEqual([start for start, offset, size in ppds_payload.blocks],
+                         [0, 1000, 2000])
+        for start, offset, size in ppds_payload.blocks:
+            block = ppds_payload.compressed[offset:offset + size]
+            self.assertEqual(pyppd.compressor.decompress(block),
+                             ppds[start:start + 1000])
+        
+        # The blocks still make a valid xz file
+        self.assertEqual(pyppd.compressor.decompress(ppds_payload.compressed), ppds)
+    
+    def test_compress_blocks_dictionary(self):
+        """Test that blocks are compressed with the trained dictionary."""
+        ppds = self.ppd_content * 20
+        spans = [(start, len(self.ppd_content))
+                 for start in range(0, len(ppds), len(self.ppd_content))]
+        ppds_payload = pyppd.archiver.compress_blocks(ppds, 100, 'zlib', spans)
+        codec = pyppd.compressor.get_codec('zlib')
+        
+        self.assertEqual(ppds_payload.codec, 'zlib')
+        self.assertTrue(ppds_payload.dictionary)
+        decompressed = b"".join(
+            codec.decompress(ppds_payload.compressed[offset:offset + size],
+                             ppds_payload.dictionary)
+            for start, offset, size in ppds_payload.blocks)
+        self.assertEqual(decompressed, ppds)
+    
+    def test_reindex_codec(self):
+        """Test changing the codec of an archive."""
+        archive_content = pyppd.archiver.archive(self.test_dir)
+        reindexed = pyppd.archiver.reindex(archive_content, codec='zlib')
+        
+        self.assertEqual(pyppd.archiver.extract(reindexed),
+                         pyppd.archiver.extract(archive_content))
+        with zipfile.ZipFile(io.BytesIO(reindexed)) as z:
+            self.assertEqual(marshal.loads(z.read('index'))['codec'], 'zlib')
+    
+    def test_reindex_legacy(self):
+        """Test rebuilding an archive with a single base64 encoded stream."""
+        ppds = self.ppd_content * 2
+        description = ('"%d/test.ppd" en "Test Manufacturer" "Test Printer" '
+                       '"MFG:Test Manufacturer;MDL:Test Model;"')
+        ppds_index = {
+            '0/test.ppd': [0, len(self.ppd_content), [description % 0, description % 1]],
+            '1/test.ppd': [0, len(self.ppd_content), [description % 0, description % 1]],
+            '0/test2.ppd': [len(self.ppd_content), len(self.ppd_content), []],
+            'ARCHIVE': base64.b64encode(pyppd.compressor.compress(ppds)).decode('ascii'),
+        }
+        legacy = (b'#!/usr/bin/env python3\n'
+                  b'# PPDs Archive\n'
+                  b'ppds_compressed_b64 = b"' +
+                  base64.b64encode(pyppd.compressor.compress(
+                      json.dumps(ppds_index, sort_keys=True).encode('utf-8'))) +
+                  b'"\n')
+        
+        archive_content = pyppd.archiver.reindex(legacy, 100)
+        ppds_index, ppds_list, ppds_extracted = pyppd.archiver.extract(archive_content)
+        self.assertEqual(ppds_extracted, ppds)
+        self.assertEqual(ppds_index, {'test.ppd': (0, len(self.ppd_content)),
+                                      'test2.ppd': (len(self.ppd_content),
+                                                    len(self.ppd_content))})
+        self.assertEqual(ppds_list, [description % 0, description % 1])
+        
+        with zipfile.ZipFile(io.BytesIO(archive_content)) as z:
+            index = marshal.loads(z.read('index'))
+        self.assertEqual(len(index['blocks']), 3)
+    
+    def test_reindex(self):
+        """Test that reindexing an archive keeps its PPDs and listing."""
+        archive_content = pyppd.archiver.archive(self.test_dir)
+        reindexed = pyppd.archiver.reindex(archive_content, 64)
+        
+        self.assertEqual(pyppd.archiver.extract(reindexed),
+                         pyppd.archiver.extract(archive_content))
+        self.assertEqual(pyppd.archiver.reindex(reindexed), archive_content)
+    
+    def test_extract_not_archive(self):
+        """Test that files other than archives are rejected."""
+        with self.assertRaises(ValueError):
+            pyppd.archiver.extract(b"#!/bin/sh\n")
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as z:
+            z.writestr("__main__.py", "")
+        with self.assertRaises(ValueError):
+            pyppd.archiver.extract(output.getvalue())
+    
+    def test_compress_delta(self):
+        """Test storing similar PPDs as deltas."""
+        options = b"".join(b'*Option%d: "value %d"\n' % (i, i)
+                           for i in range(200))
+        with open(self.ppd_file, "ab") as f:
+            f.write(options)
+        with open(self.ppd_file2, "ab") as f:
+            f.write(options + b'*Extra: "option"\n')
+        ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+            self.test_dir, codec="zlib", delta=True)
+        self.assertEqual(ppds_index['subdir/test2.ppd'][2:], ())
+        self.assertEqual(ppds_index['test.ppd'][2], 'subdir/test2.ppd')
+        
+        # Deltas are rebuilt when extracting, and when reading
+        archive = pyppd.archiver.build(ppds_index, ppds_list, ppds_payload)
+        ppds_index, ppds_list, ppds = pyppd.archiver.extract(archive)
+        for filename, ppd_file in (('test.ppd', self.ppd_file),
+                                   ('subdir/test2.ppd', self.ppd_file2)):
+            with open(ppd_file, "rb") as f:
+                ppd_content = f.read()
+            start, length = ppds_index[filename]
+            self.assertEqual(ppds[start:start + length], ppd_content)
+        self.assertEqual(pyppd.archiver.reindex(archive, codec="zlib"),
+                         pyppd.archiver.archive(self.test_dir, codec="zlib"))
+        self.assertEqual(pyppd.archiver.reindex(archive, codec="zlib",
+                                                delta=True),
+                         archive)
         
-        # Check PPD URIs
-        uris = [key for key in ppds_index.keys() if key != 'ARCHIVE']
-        expected_uris = ['0/test.ppd', '0/subdir/test2.ppd']
-        for uri in expected_uris:
-            self.assertTrue(any(uri in found_uri for found_uri in uris))
+        # Hot PPDs are never stored as deltas
+        ppds_index = pyppd.archiver.compress(
+            self.test_dir, codec="zlib", delta=True,
+            weights={'test.ppd': 1})[0]
+        self.assertEqual(len(ppds_index['test.ppd']), 2)
+        
+        # Reindexing with the same options gives the same archive back
+        for weights in (None, {'test.ppd': 1}):
+            for order in pyppd.archiver.ORDERS:
+                archive = pyppd.archiver.archive(
+                    self.test_dir, codec="zlib", weights=weights,
+                    delta=True, order=order)
+                self.assertEqual(pyppd.archiver.reindex(
+                    archive, codec="zlib", weights=weights, delta=True,
+                    order=order), archive)
+    
+    def test_compress_order(self):
+        """Test putting similar PPDs together, keeping their URIs."""
+        options = b"".join(b'*Option%d: "value %d"\n' % (i, i)
+                           for i in range(200))
+        for ppd_file in (self.ppd_file, self.ppd_file2):
+            with open(ppd_file, "ab") as f:
+                f.write(options)
+        with open(os.path.join(self.test_dir, "subdir", "unlike.ppd"),
+                  "wb") as f:
+            f.write(self.ppd_content.replace(b"Test Printer", b"Unlike") +
+                    options.replace(b"value", b"other"))
+        with open(os.path.join(self.test_dir, "other.ppd"), "wb") as f:
+            f.write(self.ppd_content.replace(b"Test Manufacturer",
+                                             b"Another"))
+        
+        ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+            self.test_dir, order="similarity")
+        self.assertEqual(sorted(ppds_index, key=ppds_index.get),
+                         ['other.ppd', 'subdir/test2.ppd', 'test.ppd',
+                          'subdir/unlike.ppd'])
+        # Only the layout changes
+        name_ordered = pyppd.archiver.compress(self.test_dir)
+        self.assertEqual(list(ppds_index), list(name_ordered[0]))
+        self.assertEqual(ppds_list, name_ordered[1])
+        archive = pyppd.archiver.build(ppds_index, ppds_list, ppds_payload)
+        self.assertEqual(pyppd.archiver.reindex(archive),
+                         pyppd.archiver.archive(self.test_dir))
+        self.assertEqual(pyppd.archiver.reindex(
+            pyppd.archiver.archive(self.test_dir), order="similarity"),
+            archive)
+    
+    def test_jobs(self):
+        """Test that archives don't depend on the number of jobs."""
+        for i in range(20):
+            with open(os.path.join(self.test_dir, "test%d.ppd" % i), "wb") as f:
+                f.write(self.ppd_content.replace(b"Test Printer",
+                                                 b"Printer %d" % i) * (i + 1))
+        for codec in ("xz", "zlib"):
+            archive_content = pyppd.archiver.archive(self.test_dir, 256, codec,
+                                                     jobs=1)
+            for jobs in (2, 4):
+                self.assertEqual(pyppd.archiver.archive(
+                    self.test_dir, 256, codec, jobs=jobs), archive_content)
+                self.assertEqual(pyppd.archiver.reindex(
+                    archive_content, 256, codec, jobs=jobs), archive_content)
+    
+    def test_block_spans(self):
+        """Test that blocks end at breaks and at most after block_size."""
+        self.assertEqual(list(pyppd.archiver.block_spans(10, 4)),
+                         [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(list(pyppd.archiver.block_spans(10, 4, [1, 3])),
+                         [(0, 1), (1, 3), (3, 7), (7, 10)])
+    
+    def test_stream_blocks(self):
+        """Test that streamed blocks are cut as block_spans() does."""
+        ppd_files = [(b"a" * 3, False), (b"b" * 6, True), (b"c" * 2, False),
+                     (b"d" * 5, True), (b"e" * 4, False)]
+        ppds = b"".join(ppd_file for ppd_file, ends_block in ppd_files)
+        breaks = [9, 16]
+        
+        self.assertEqual(list(pyppd.archiver.stream_blocks(ppd_files, 4)),
+                         [(start, ppds[start:end]) for start, end
+                          in pyppd.archiver.block_spans(len(ppds), 4, breaks)])
+    
+    def test_ordered_map(self):
+        """Test that results keep the order of the arguments."""
+        results = pyppd.archiver.ordered_map(lambda x, y: x * y,
+                                             ((i, 2) for i in range(100)), 4)
+        self.assertEqual(list(results), [i * 2 for i in range(100)])
+    
+    def test_write(self):
+        """Test writing an archive to a file as it is compressed."""
+        for codec in ('xz', 'zlib'):
+            output = io.BytesIO()
+            self.assertTrue(pyppd.archiver.write(output, self.test_dir,
+                                                 codec=codec, jobs=2))
+            ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+                self.test_dir, codec=codec)
+            self.assertEqual(output.getvalue(),
+                             pyppd.archiver.build(ppds_index, ppds_list,
+                                                  ppds_payload))
+    
+    def test_replace_file(self):
+        """Test that files are only replaced once completely written."""
+        path = os.path.join(self.test_dir, "archive")
+        with open(path, "wb") as f:
+            f.write(b"old")
+        os.chmod(path, 0o640)
+        
+        with self.assertRaises(RuntimeError):
+            with pyppd.archiver.replace_file(path) as f:
+                f.write(b"half")
+                raise RuntimeError()
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"old")
+        
+        with pyppd.archiver.replace_file(path) as f:
+            f.write(b"new")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"new")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o740)
+        self.assertEqual(sorted(os.listdir(self.test_dir)),
+                         ["archive", "subdir", "test.ppd"])
+    
+    def test_read_weights(self):
+        """Test reading weights and access logs."""
+        weights_file = os.path.join(self.test_dir, "weights")
+        with open(weights_file, "w") as f:
+            f.write("# comment\n"
+                    "pyppd-ppdfile:0/test.ppd\n"
+                    "renamed:1/test.ppd\n"
+                    "0/subdir/test2.ppd 2.5\n")
+        self.assertEqual(pyppd.archiver.read_weights(weights_file),
+                         {'test.ppd': 2, 'subdir/test2.ppd': 2.5})
+    
+    def test_hottest(self):
+        """Test picking the most requested PPDs."""
+        weights = {'a.ppd': 1, 'b.ppd': 3, 'c.ppd': 1, 'd.ppd': 0}
+        filenames = ['a.ppd', 'b.ppd', 'c.ppd', 'd.ppd', 'e.ppd']
+        self.assertEqual(pyppd.archiver.hottest(filenames, weights),
+                         ['b.ppd', 'a.ppd', 'c.ppd'])
+        self.assertEqual(pyppd.archiver.hottest(filenames, weights, 2),
+                         ['b.ppd', 'a.ppd'])
+    
+    def test_compress_weights(self):
+        """Test that the hot PPDs come first, each in its own block."""
+        ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+            self.test_dir, weights={'test.ppd': 1})
+        
+        length = len(self.ppd_content)
+        self.assertEqual(ppds_index, {'subdir/test2.ppd': (length, length),
+                                      'test.ppd': (0, length)})
+        self.assertEqual([start for start, offset, size in ppds_payload.blocks],
+                         [0, length])
+        # URIs and listing don't depend on the layout
+        self.assertEqual(ppds_list, pyppd.archiver.compress(self.test_dir)[1])
+    
+    def test_reindex_weights(self):
+        """Test laying out an existing archive by weights."""
+        archive_content = pyppd.archiver.archive(self.test_dir)
+        reindexed = pyppd.archiver.reindex(archive_content,
+                                           weights={'test.ppd': 1})
+        
+        self.assertEqual(reindexed, pyppd.archiver.archive(
+            self.test_dir, weights={'test.ppd': 1}))
+    
+    def test_list_text(self):
+        """Test that the list output is stored without opening quotes."""
+        text = pyppd.archiver.list_text(['"0/a.ppd" en "A" "A 1" ""',
+                                         '"1/a.ppd" en "A" "A 2" ""'])
+        self.assertEqual(text, b'0/a.ppd" en "A" "A 1" ""\n'
+                               b'1/a.ppd" en "A" "A 2" ""')
     
     def test_archive(self):
         """Test creating an executable archive."""
         archive_content = pyppd.archiver.archive(self.test_dir)
     
         self.assertIsNotNone(archive_content)
-        # Verify compressor functions exist
-        self.assertIn(b"def compress(value):", archive_content)
-        self.assertIn(b"def decompress(value):", archive_content)
-       # Verify placeholders replaced
-        self.assertNotIn(b"@compressor@", archive_content)
-        self.assertNotIn(b"@ppds_compressed_b64@", archive_content)
+        self.assertTrue(archive_content.startswith(b"#!/usr/bin/env python3\n"))
+        
+        # The archive is a zipapp with the decompressor and the index
+        with zipfile.ZipFile(io.BytesIO(archive_content)) as z:
+            self.assertEqual(z.namelist(),
+                             ['__main__.py', '__main__.pyc', 'compressor.py',
+                              'compressor.pyc', 'delta.py', 'delta.pyc',
+                              'index', 'dictionary', 'list', 'digest'])
+            main_py = z.read('__main__.py')
+            index = marshal.loads(z.read('index'))
+            ppds_list = z.read('list')
+        self.assertIn(b"def cat(ppd):", main_py)
+        self.assertEqual(sorted(index['ppds']), ['subdir/test2.ppd', 'test.ppd'])
+        self.assertEqual(ppds_list.count(b"\n"), 1)
+        
+        # The payload is stored raw right after the "#!" line
+        offset, size = index['payload']
+        payload = archive_content[offset:offset + size]
+        self.assertEqual(len(pyppd.compressor.decompress(payload)),
+                         2 * len(self.ppd_content))
+    
+    def test_archive_is_reproducible(self):
+        """Test that archiving the same PPDs twice gives the same bytes."""
+        self.assertEqual(pyppd.archiver.archive(self.test_dir),
+                         pyppd.archiver.archive(self.test_dir))
 
 if __name__ == '__main__':
     unittest.main()
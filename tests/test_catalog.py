@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import unittest
+import tempfile
+import os
+import shutil
+import zipfile
+import pyppd.archiver
+import pyppd.catalog
+
+class TestCatalog(unittest.TestCase):
+    """Test the catalog of the installed archives."""
+    
+    def setUp(self):
+        """Create a drivers directory with an archive and another driver."""
+        self.test_dir = tempfile.mkdtemp()
+        ppds_dir = os.path.join(self.test_dir, "ppds")
+        os.makedirs(ppds_dir)
+        with open(os.path.join(ppds_dir, "test.ppd"), "wb") as f:
+            f.write(b"""*LanguageVersion: English
+*Manufacturer: "Test Manufacturer"
+*NickName: "Test Printer"
+*ModelName: "Test Model"
+""")
+        self.drivers = os.path.join(self.test_dir, "drivers")
+        os.makedirs(self.drivers)
+        self.archive = pyppd.archiver.archive(ppds_dir)
+        for name in ("pyppd-ppdfile", "renamed-ppdfile"):
+            with open(os.path.join(self.drivers, name), "wb") as f:
+                f.write(self.archive)
+        with open(os.path.join(self.drivers, "other-driver"), "wb") as f:
+            f.write(b"#!/bin/sh\n")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def test_build(self):
+        """Test cataloging the lists of the archives."""
+        with zipfile.ZipFile(os.path.join(self.drivers, "pyppd-ppdfile")) as z:
+            digest = z.read("digest")
+            ppds_list = z.read("list")
+        catalog = pyppd.catalog.build(self.drivers)
+        self.assertTrue(catalog.startswith(pyppd.catalog.MAGIC))
+        # Copies of an archive share their entry
+        self.assertEqual(pyppd.catalog.read(catalog), {digest: ppds_list})
+        with self.assertRaises(ValueError):
+            pyppd.catalog.read(self.archive)
+    
+    def test_path(self):
+        """Test the catalog's path can be overridden by the environment."""
+        catalog = os.environ.pop("PYPPD_CATALOG", None)
+        try:
+            self.assertEqual(pyppd.catalog.path(), pyppd.catalog.CATALOG)
+            os.environ["PYPPD_CATALOG"] = "/tmp/catalog"
+            self.assertEqual(pyppd.catalog.path(), "/tmp/catalog")
+        finally:
+            os.environ.pop("PYPPD_CATALOG")
+            if catalog is not None:
+                os.environ["PYPPD_CATALOG"] = catalog
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import unittest
+import tempfile
+import os
+import shutil
+import gzip
+import json
+import pyppd.checker
+
+class TestChecker(unittest.TestCase):
+    """Test checking PPD trees."""
+    
+    def setUp(self):
+        """Create a temporary directory with good and bad PPD files."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ppd_content = b"""*LanguageVersion: English
+*Manufacturer: "Test Manufacturer"
+*NickName: "Test Printer"
+*1284DeviceID: "MFG:Test Manufacturer;MDL:Test Printer;"
+"""
+        self.write("good.ppd", self.ppd_content)
+        os.makedirs(os.path.join(self.test_dir, "subdir"))
+        self.write("subdir/copy.ppd", self.ppd_content)
+        with gzip.open(os.path.join(self.test_dir, "subdir", "copy.ppd.gz"),
+                       "wb") as f:
+            f.write(self.ppd_content)
+        self.write("klingon.ppd", b"""*LanguageVersion: Klingon
+*Manufacturer: "Test Manufacturer"
+*NickName: "Other Printer"
+""")
+        self.write("broken.ppd.gz", b"not gzipped")
+    
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+    
+    def write(self, filename, content):
+        with open(os.path.join(self.test_dir, filename), "wb") as f:
+            f.write(content)
+    
+    def test_check(self):
+        """Test every problem is reported, past the failing PPDs."""
+        report = pyppd.checker.check(self.test_dir, jobs=2)
+        self.assertEqual(report["ppds"], 5)
+        self.assertEqual(report["entries"], 3)
+        self.assertEqual([error["file"] for error in report["errors"]],
+                         ["broken.ppd.gz"])
+        self.assertEqual(report["unknown_languages"],
+                         [{"file": "klingon.ppd", "language": "Klingon"}])
+        self.assertEqual(report["missing_keywords"], [])
+        self.assertEqual(report["duplicate_uris"],
+                         [{"filename": "subdir/copy.ppd",
+                           "files": ["subdir/copy.ppd",
+                                     "subdir/copy.ppd.gz"]}])
+        self.assertEqual(report["deviceid_collisions"],
+                         [{"deviceid": "MFG:Test Manufacturer;"
+                                       "MDL:Test Printer;",
+                           "uris": ["0/good.ppd", "0/subdir/copy.ppd",
+                                    "0/subdir/copy.ppd"]}])
+        self.assertEqual(pyppd.checker.problems(report), 4)
+        # The report is meant to be dumped as JSON
+        self.assertEqual(json.loads(json.dumps(report)), report)
+        # And doesn't depend on how the PPDs are shared among processes
+        batch_size = pyppd.checker.BATCH_SIZE
+        pyppd.checker.BATCH_SIZE = 2
+        try:
+            self.assertEqual(pyppd.checker.check(self.test_dir, jobs=1),
+                             report)
+        finally:
+            pyppd.checker.BATCH_SIZE = batch_size
+    
+    def test_check_missing_keywords(self):
+        """Test missing keywords are reported."""
+        shutil.rmtree(self.test_dir)
+        os.makedirs(self.test_dir)
+        self.write("empty.ppd", b"*PPD-Adobe: \"4.3\"\n")
+        report = pyppd.checker.check(self.test_dir)
+        self.assertEqual(report["missing_keywords"],
+                         [{"file": "empty.ppd", "keyword": keyword}
+                          for keyword in ("LanguageVersion", "Manufacturer",
+                                          "NickName")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 import unittest
 import tempfile
 import os
+import importlib.util
 import pyppd.compressor
 
 class TestCompressor(unittest.TestCase):
@@ -43,6 +44,64 @@ class TestCompressor(unittest.TestCase):
         finally:
             os.unlink(filename)
 
+    def test_codecs(self):
+        """Test that every available codec restores the original data."""
+        test_data = b"*OpenUI *PageSize: PickOne\n*DefaultPageSize: A4\n" * 50
+        for name in pyppd.compressor.CODECS:
+            try:
+                codec = pyppd.compressor.get_codec(name)
+            except pyppd.compressor.CodecError:
+                continue
+            dictionary = codec.train([test_data] * 10)
+            compressed = codec.compress(test_data, dictionary)
+            self.assertLess(len(compressed), len(test_data))
+            self.assertEqual(codec.decompress(compressed, dictionary), test_data)
+    
+    def test_decompress_stream(self):
+        """Test that codecs decompress in chunks of bounded size."""
+        test_data = b"".join(b"*Option%d: \"value %d\"\n" % (i, i)
+                             for i in range(2000))
+        for name in pyppd.compressor.CODECS:
+            try:
+                codec = pyppd.compressor.get_codec(name)
+            except pyppd.compressor.CodecError:
+                continue
+            dictionary = codec.train([test_data[:5000]] * 10)
+            compressed = codec.compress(test_data, dictionary)
+            chunks = list(codec.decompress_stream(compressed, dictionary, 1000))
+            self.assertEqual(b"".join(chunks), test_data)
+            self.assertLessEqual(max(len(chunk) for chunk in chunks), 1000)
+        # The fallback decompresses whole, and yields chunks all the same
+        codec = pyppd.compressor.get_codec('xz')
+        chunks = list(pyppd.compressor.Codec.decompress_stream(
+            codec, codec.compress(test_data), chunk_size=1000))
+        self.assertEqual(b"".join(chunks), test_data)
+    
+    def test_zlib_dictionary(self):
+        """Test that the trained dictionary helps compressing small data."""
+        samples = [b"*Manufacturer: \"Test\"\n*NickName: \"Test %d\"\n"
+                   b"*OpenUI *PageSize: PickOne\n*CloseUI: *PageSize\n" % i
+                   for i in range(10)]
+        codec = pyppd.compressor.get_codec('zlib')
+        dictionary = codec.train(samples)
+        
+        self.assertIn(b"*OpenUI *PageSize: PickOne\n", dictionary)
+        self.assertNotIn(b"Test 1", dictionary)
+        self.assertLess(len(codec.compress(samples[0], dictionary)),
+                        len(codec.compress(samples[0])))
+    
+    def test_unknown_codec(self):
+        """Test that unknown codecs are reported."""
+        with self.assertRaises(pyppd.compressor.CodecError):
+            pyppd.compressor.get_codec('foo')
+    
+    @unittest.skipIf(importlib.util.find_spec('zstandard'),
+                     'zstandard is installed')
+    def test_unavailable_codec(self):
+        """Test that codecs whose module is missing are reported."""
+        with self.assertRaises(pyppd.compressor.CodecError):
+            pyppd.compressor.get_codec('zstd')
+
 if __name__ == '__main__':
     unittest.main()
 
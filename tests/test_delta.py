@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import unittest
+import pyppd.delta
+
+class TestDelta(unittest.TestCase):
+    """Test the delta encoding of similar PPDs."""
+    
+    def setUp(self):
+        """Create PPDs of two families."""
+        self.options = b"".join(b'*Option%d: "value %d"\n' % (i, i)
+                                for i in range(200))
+        self.laser = [b'*NickName: "Laser %d"\n' % i + self.options +
+                      b'*Resolution: "%ddpi"\n' % (300 * i)
+                      for i in range(1, 4)]
+        self.inkjet = b"".join(b'*Ink%d: "color %d"\n' % (i, i)
+                               for i in range(200))
+    
+    def test_encode_apply(self):
+        """Test PPDs are rebuilt exactly from their base and delta."""
+        base = self.laser[0]
+        ppds = self.laser[1:] + [
+            self.inkjet,
+            b"",
+            base,
+            # Lines moved around, other line endings, no final newline
+            self.options[2000:] + self.options[:2000],
+            base.replace(b"\n", b"\r\n"),
+            base[:-1],
+        ]
+        for ppd in ppds:
+            delta = pyppd.delta.encode(base, ppd)
+            self.assertEqual(pyppd.delta.apply(base, delta), ppd)
+        # Similar PPDs only store what differs
+        self.assertLess(len(pyppd.delta.encode(base, self.laser[1])), 100)
+        self.assertEqual(pyppd.delta.apply(b"", pyppd.delta.encode(b"", base)),
+                         base)
+    
+    def test_similarity(self):
+        """Test the similarity estimated from sketches."""
+        sketches = [pyppd.delta.sketch(ppd) for ppd in self.laser]
+        inkjet = pyppd.delta.sketch(self.inkjet)
+        self.assertEqual(len(inkjet), pyppd.delta.SKETCH_SIZE)
+        self.assertEqual(pyppd.delta.similarity(sketches[0], sketches[0]), 1.0)
+        self.assertGreater(pyppd.delta.similarity(sketches[0], sketches[1]),
+                           0.9)
+        self.assertLess(pyppd.delta.similarity(sketches[0], inkjet), 0.1)
+        self.assertEqual(pyppd.delta.similarity((), ()), 0.0)
+    
+    def test_cluster(self):
+        """Test similar PPDs get the first of them as their base."""
+        ppds = [self.laser[0], self.inkjet] + self.laser[1:] + [
+            self.inkjet + b'*Ink: "black"\n']
+        bases = pyppd.delta.cluster([pyppd.delta.sketch(ppd) for ppd in ppds])
+        self.assertEqual(bases, [None, None, 0, 0, 1])
+
+if __name__ == '__main__':
+    unittest.main()
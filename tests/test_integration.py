@@ -66,7 +66,9 @@ class TestIntegration(unittest.TestCase):
         # List the PPDs in the archive
         list_result = subprocess.run(["./pyppd-ppdfile", "list"],
                            check=True, capture_output=True)
-        self.assertIn(b"pyppd-ppdfile:0/test.ppd", list_result.stdout)
+        self.assertEqual(list_result.stdout,
+                         b'"pyppd-ppdfile:0/test.ppd" en "Test Manufacturer" '
+                         b'"Test Printer" "MFG:Test Manufacturer;MDL:Test Model;"\n')
         
         # Extract a PPD from the archive
         cat_result = subprocess.run(["./pyppd-ppdfile", "cat", "pyppd-ppdfile:test.ppd"],
@@ -100,5 +102,129 @@ class TestIntegration(unittest.TestCase):
                                 check=True, capture_output=True)
         self.assertEqual(cat_result.stdout, self.ppd_content)
 
+    def test_index_workflow(self):
+        """Test reindexing an archive in place and using it."""
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        subprocess.run([sys.executable, "bin/pyppd", "-o", output_path, self.test_dir],
+                       check=True, capture_output=True)
+        subprocess.run([sys.executable, "bin/pyppd", "-b", "16", "index", output_path],
+                       check=True, capture_output=True)
+        
+        self.assertTrue(os.access("pyppd-ppdfile", os.X_OK))
+        cat_result = subprocess.run(["./pyppd-ppdfile", "cat", "pyppd-ppdfile:test.ppd"],
+                                    check=True, capture_output=True)
+        self.assertEqual(cat_result.stdout, self.ppd_content)
+    
+    def test_codec_workflow(self):
+        """Test an archive compressed with another codec."""
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        subprocess.run([sys.executable, "bin/pyppd", "-c", "zlib", "-o", output_path,
+                        self.test_dir], check=True, capture_output=True)
+        
+        cat_result = subprocess.run([sys.executable, "-I", "-S", "pyppd-ppdfile",
+                                     "cat", "pyppd-ppdfile:test.ppd"],
+                                    check=True, capture_output=True)
+        self.assertEqual(cat_result.stdout, self.ppd_content)
+    
+    def test_delta_workflow(self):
+        """Test extracting a PPD stored as a delta."""
+        ppd_content = self.ppd_content + b"".join(
+            b'*Option%d: "value %d"\n' % (i, i) for i in range(200))
+        with open(self.ppd_file, "wb") as f:
+            f.write(ppd_content)
+        with open(os.path.join(self.test_dir, "similar.ppd"), "wb") as f:
+            f.write(ppd_content.replace(b"Test Printer", b"Similar Printer"))
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        subprocess.run([sys.executable, "bin/pyppd", "--delta", "-o", output_path,
+                        self.test_dir], check=True, capture_output=True)
+        
+        cat_result = subprocess.run([sys.executable, "-I", "-S", "pyppd-ppdfile",
+                                     "cat", "pyppd-ppdfile:0/test.ppd"],
+                                    check=True, capture_output=True)
+        self.assertEqual(cat_result.stdout, ppd_content)
+    
+    def test_weights_workflow(self):
+        """Test laying out an archive with its own access log."""
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        access_log = os.path.join(self.test_dir, "access.log")
+        subprocess.run([sys.executable, "bin/pyppd", "-o", output_path, self.test_dir],
+                       check=True, capture_output=True)
+        subprocess.run(["./pyppd-ppdfile", "cat", "pyppd-ppdfile:0/test.ppd"],
+                       check=True, capture_output=True,
+                       env=dict(os.environ, PYPPD_ACCESS_LOG=access_log))
+        with open(access_log) as f:
+            self.assertEqual(f.read(), "pyppd-ppdfile:0/test.ppd\n")
+        
+        subprocess.run([sys.executable, "bin/pyppd", "-w", access_log, "index", output_path],
+                       check=True, capture_output=True)
+        cat_result = subprocess.run(["./pyppd-ppdfile", "cat", "pyppd-ppdfile:test.ppd"],
+                                    check=True, capture_output=True)
+        self.assertEqual(cat_result.stdout, self.ppd_content)
+    
+    def test_catalog_workflow(self):
+        """Test listing an archive from the catalog of the drivers."""
+        drivers = os.path.join(self.test_dir, "drivers")
+        os.makedirs(drivers)
+        archive = os.path.join(drivers, "pyppd-ppdfile")
+        catalog = os.path.join(self.test_dir, "cache", "catalog")
+        env = dict(os.environ, PYPPD_CATALOG=catalog)
+        subprocess.run([sys.executable, "bin/pyppd", "-o", archive, self.test_dir],
+                       check=True, capture_output=True)
+        subprocess.run([sys.executable, "bin/pyppd", "index-drivers", drivers],
+                       check=True, capture_output=True, env=env)
+        
+        list_result = subprocess.run([archive, "list"], check=True,
+                                     capture_output=True, env=env)
+        self.assertIn(b'pyppd-ppdfile:0/test.ppd" en "Test Manufacturer" '
+                      b'"Test Printer"', list_result.stdout)
+        
+        # The list is read from the catalog
+        with open(catalog, "rb") as f:
+            catalog_content = f.read()
+        with open(catalog, "wb") as f:
+            f.write(catalog_content.replace(b"Test Printer", b"Catalogued!!"))
+        list_result = subprocess.run([sys.executable, "-I", "-S", archive, "list"],
+                                     check=True, capture_output=True, env=env)
+        self.assertIn(b'"Catalogued!!"', list_result.stdout)
+        
+        # But not once the archive has changed
+        with open(os.path.join(self.test_dir, "other.ppd"), "wb") as f:
+            f.write(self.ppd_content)
+        subprocess.run([sys.executable, "bin/pyppd", "-o", archive, self.test_dir],
+                       check=True, capture_output=True)
+        list_result = subprocess.run([archive, "list"], check=True,
+                                     capture_output=True, env=env)
+        self.assertNotIn(b'"Catalogued!!"', list_result.stdout)
+        self.assertIn(b"pyppd-ppdfile:0/other.ppd", list_result.stdout)
+    
+    def test_isolated_workflow(self):
+        """Test that the archive runs without site-packages (-I -S)."""
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        subprocess.run([sys.executable, "bin/pyppd", "-o", output_path, self.test_dir],
+                       check=True, capture_output=True)
+        
+        list_result = subprocess.run([sys.executable, "-I", "-S", "pyppd-ppdfile", "list"],
+                                     check=True, capture_output=True)
+        self.assertIn(b"pyppd-ppdfile:0/test.ppd", list_result.stdout)
+        
+        cat_result = subprocess.run([sys.executable, "-I", "-S", "pyppd-ppdfile",
+                                     "cat", "pyppd-ppdfile:test.ppd"],
+                                    check=True, capture_output=True)
+        self.assertEqual(cat_result.stdout, self.ppd_content)
+    
+    def test_list_imports(self):
+        """Test that listing only imports what it needs."""
+        output_path = os.path.join(os.getcwd(), "pyppd-ppdfile")
+        subprocess.run([sys.executable, "bin/pyppd", "-o", output_path, self.test_dir],
+                       check=True, capture_output=True)
+        
+        list_result = subprocess.run([sys.executable, "-I", "-S", "-X", "importtime",
+                                      "pyppd-ppdfile", "list"],
+                                     check=True, capture_output=True)
+        imported = [line.split(b"|")[-1].strip()
+                    for line in list_result.stderr.splitlines()]
+        for module in (b"optparse", b"json", b"subprocess", b"base64", b"lzma"):
+            self.assertNotIn(module, imported)
+
 if __name__ == '__main__':
     unittest.main()
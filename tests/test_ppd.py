@@ -99,6 +99,93 @@ class TestPPD(unittest.TestCase):
         finally:
             os.unlink(filename)
 
+    def test_parse_device_ids(self):
+        """Test the DRV and MODEL/MDL fields of Device IDs, and products
+        already given by one."""
+        ppd_content = b"""*LanguageVersion: English
+*Manufacturer: "HP"
+*NickName: "HP LaserJet"
+*ModelName: "HP LaserJet"
+*1284DeviceID: "MFG:HP;MDL:HP LaserJet 1; drv: Dhp, r1 ;"
+*1284DeviceID: "MFG:HP;CMD:PCL;"
+*1284DeviceID: "MFG:HP;Model: Hewlett-Packard LaserJet 2"
+*1284DeviceID: "MFG:HP;MDL:LaserJet 3;DRV:DRV:Dhp,r2;"
+*Product: "(hewlett-packard laserjet 1)"
+*Product: "(HP LaserJet 2)"
+*Product: "(LaserJet 3)"
+*Product: "(LaserJet 4)"
+*Product: "(hp laserjet 4)"
+"""
+        parsed = pyppd.ppd.parse(ppd_content, "test.ppd")
+        self.assertEqual([(ppd.uri, ppd.deviceid) for ppd in parsed],
+                         [("0/test.ppd", "MFG:HP;MDL:HP LaserJet 1; drv: Dhp, r1 ;"),
+                          ("1/test.ppd", "MFG:HP;Model: Hewlett-Packard LaserJet 2;"
+                                         "DRV:Dhp, r1;"),
+                          ("2/test.ppd", "MFG:HP;MDL:LaserJet 3;DRV:DRV:Dhp,r2;"),
+                          ("3/test.ppd", "MFG:HP;MDL:LaserJet 4;DRV:Dhp,r2;")])
+    
+    def test_field(self):
+        """Test finding the last field of a Device ID with a value."""
+        field = pyppd.ppd.field
+        self.assertEqual(field("MFG:A;MDL: B C ;", pyppd.ppd.MODEL_FIELD_RE),
+                         "B C")
+        self.assertEqual(field("MODEL:A;mdl:B;", pyppd.ppd.MODEL_FIELD_RE),
+                         "B")
+        self.assertEqual(field("DRV:A;DRV:B", pyppd.ppd.DRV_FIELD_RE), "A")
+        self.assertEqual(field("CMD:XDRV:;", pyppd.ppd.DRV_FIELD_RE), "")
+        self.assertIsNone(field("MFG:A;", pyppd.ppd.DRV_FIELD_RE))
+        self.assertIsNone(field("DRV:A", pyppd.ppd.DRV_FIELD_RE))
+    
+    def test_parse_errors(self):
+        """Test the problems of PPDs which can't be parsed are reported."""
+        with self.assertRaises(pyppd.ppd.PPDError) as cm:
+            pyppd.ppd.parse(b"""*LanguageVersion: Klingon
+*NickName: "Test Printer"
+""", "test.ppd")
+        self.assertEqual(cm.exception.filename, "test.ppd")
+        self.assertEqual(cm.exception.problems,
+                         [("LanguageVersion", "Klingon"),
+                          ("Manufacturer", None)])
+        self.assertIn("no *Manufacturer", str(cm.exception))
+    
+    def test_keyword_scanner(self):
+        """Test parsing the lines kept by KeywordScanner gives the same PPDs."""
+        ppd_content = b"""*PPD-Adobe: "4.3"
+*% *Product: "(Commented)"
+*LanguageVersion:
+   English
+*Manufacturer:  "Test Manufacturer"
+*% body
+*NickName: "Test Printer" *ModelName: "Test Model"
+*1284DeviceID:
+"MFG:Test;MDL:Test Printer 1;DRV:Dtest;"
+*1284DeviceID: "MFG:Test;
+   MDL:Test Printer 2;"
+*Product:
+  "(
+  Test Printer 3
+  )"
+*Product: "(Test Printer 4
+)"
+*Product: "(Test Printer 5)"
+*OpenUI *PageSize: PickOne
+*PageSize Letter: "<</PageSize[612 792]>>setpagedevice"
+*CloseUI: *PageSize
+*Product: "(Test Printer 6)"
+*Product: "(Test Printer 7)\""""
+        expected = [str(ppd) for ppd in
+                    pyppd.ppd.parse(ppd_content, "test.ppd")]
+        self.assertEqual(len(expected), 7)
+        for chunk_size in range(1, len(ppd_content) + 1):
+            scanner = pyppd.ppd.KeywordScanner()
+            for i in range(0, len(ppd_content), chunk_size):
+                scanner.feed(ppd_content[i:i + chunk_size])
+            keywords = scanner.close()
+            self.assertNotIn(b"*CloseUI", keywords)
+            self.assertEqual([str(ppd) for ppd in
+                              pyppd.ppd.parse(keywords, "test.ppd")],
+                             expected)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import unittest
+import tempfile
+import os
+import shutil
+import threading
+import asyncio
+import time
+import zipfile
+import pyppd.archiver
+import pyppd.compressor
+import pyppd.reader
+
+class TestReader(unittest.TestCase):
+    """Test reading archives in process."""
+
+    def setUp(self):
+        """Create an archive of sample PPD files spread over several blocks."""
+        self.test_dir = tempfile.mkdtemp()
+        self.ppds = {}
+        for manufacturer, language in (("HP", "English"), ("Epson", "French")):
+            os.makedirs(os.path.join(self.test_dir, manufacturer))
+            for i in range(10):
+                filename = "%s/printer%d.ppd" % (manufacturer, i)
+                content = ("""*LanguageVersion: %s
+*Manufacturer: "%s"
+*NickName: "%s Printer %d"
+*1284DeviceID: "MFG:%s;MDL:Printer %d;"
+""" % (language, manufacturer, manufacturer, i, manufacturer, i)).encode()
+                content += b"*% padding\n" * (i * 20)
+                with open(os.path.join(self.test_dir, filename), "wb") as f:
+                    f.write(content)
+                self.ppds[filename] = content
+
+        self.archive_path = os.path.join(self.test_dir, "pyppd-ppdfile")
+        with open(self.archive_path, "wb") as f:
+            f.write(pyppd.archiver.archive(self.test_dir, block_size=512,
+                                           codec="zlib"))
+        self.archive = pyppd.reader.Archive(self.archive_path)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_get(self):
+        """Test getting PPDs by the URIs "cat" takes."""
+        self.assertEqual(len(self.archive), 20)
+        for filename, content in self.ppds.items():
+            self.assertEqual(self.archive.get("0/" + filename), content)
+            self.assertEqual(self.archive.get("driver:0/" + filename),
+                             content)
+        self.assertIn("driver:0/HP/printer1.ppd", self.archive)
+        self.assertNotIn("driver:0/HP/missing.ppd", self.archive)
+        with self.assertRaises(KeyError):
+            self.archive.get("0/HP/missing.ppd")
+
+    def test_get_many(self):
+        """Test getting several PPDs at once."""
+        uris = ["0/" + filename for filename in sorted(self.ppds)]
+        ppds = self.archive.get_many(reversed(uris))
+        self.assertEqual(ppds, {"0/" + filename: content
+                                for filename, content in self.ppds.items()})
+
+    def test_iter_ppds(self):
+        """Test iterating over every PPD."""
+        self.assertEqual(dict(self.archive.iter_ppds()), self.ppds)
+
+    def test_batch_decompressions(self):
+        """Test batches decompress each block once, even without cache."""
+        archive = pyppd.reader.Archive(self.archive_path, cache_size=0)
+        codec = archive._codec
+        calls = []
+        class CountingCodec(object):
+            def decompress(self, data, dictionary=b""):
+                calls.append(data)
+                return codec.decompress(data, dictionary)
+        archive._codec = CountingCodec()
+        try:
+            self.assertEqual(dict(archive.iter_ppds()), self.ppds)
+            self.assertEqual(len(calls), len(archive._blocks))
+            del calls[:]
+            uris = ["0/" + filename for filename in self.ppds]
+            self.assertEqual(len(archive.get_many(uris)), len(uris))
+            self.assertEqual(len(calls), len(archive._blocks))
+        finally:
+            archive.close()
+
+    def test_delta(self):
+        """Test reading PPDs stored as deltas."""
+        options = b"".join(b'*Option%d: "value %d"\n' % (i, i)
+                           for i in range(100))
+        for filename in self.ppds:
+            self.ppds[filename] += options
+            with open(os.path.join(self.test_dir, filename), "ab") as f:
+                f.write(options)
+        path = os.path.join(self.test_dir, "delta-ppdfile")
+        with open(path, "wb") as f:
+            f.write(pyppd.archiver.archive(self.test_dir, block_size=512,
+                                           codec="zlib", delta=True))
+        with pyppd.reader.Archive(path) as archive:
+            self.assertTrue(any(len(entry) == 3 for entry
+                                in archive._index['ppds'].values()))
+            self.assertEqual(dict(archive.iter_ppds()), self.ppds)
+            self.assertEqual(archive.get("0/HP/printer9.ppd"),
+                             self.ppds["HP/printer9.ppd"])
+
+    def test_entries(self):
+        """Test the entries are the ones listed by the archive."""
+        entries = self.archive.entries()
+        self.assertEqual(len(entries), 20)
+        entry = [entry for entry in entries
+                 if entry.uri == "0/Epson/printer3.ppd"][0]
+        self.assertEqual(entry.language, "fr")
+        self.assertEqual(entry.manufacturer, "Epson")
+        self.assertEqual(entry.nickname, "Epson Printer 3")
+        self.assertEqual(entry.deviceid, "MFG:Epson;MDL:Printer 3;")
+
+    def test_find(self):
+        """Test filtering entries by their fields."""
+        self.assertEqual(len(self.archive.find(manufacturer="hp")), 10)
+        self.assertEqual(len(self.archive.find(language="fr")), 10)
+        entries = self.archive.find(manufacturer="EPSON",
+                                    deviceid="MDL:Printer 3;")
+        self.assertEqual([entry.uri for entry in entries],
+                         ["0/Epson/printer3.ppd"])
+
+    def test_cache(self):
+        """Test the block cache stays within its size."""
+        archive = pyppd.reader.Archive(self.archive_path, cache_size=1024)
+        try:
+            for filename, content in self.ppds.items():
+                self.assertEqual(archive.get("0/" + filename), content)
+                self.assertLessEqual(archive._cache_used, 1024)
+            self.assertEqual(archive._cache_used,
+                             sum(len(text) for text in archive._cache.values()))
+        finally:
+            archive.close()
+
+    def test_threads(self):
+        """Test sharing an archive between threads."""
+        archive = pyppd.reader.Archive(self.archive_path, cache_size=1024)
+        results = []
+        def read():
+            results.append(all(archive.get("0/" + filename) == content
+                               for filename, content in self.ppds.items()))
+        threads = [threading.Thread(target=read) for i in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            archive.close()
+        self.assertEqual(results, [True] * 4)
+
+    def test_coalescing(self):
+        """Test threads wanting the same block decompress it only once."""
+        archive = pyppd.reader.Archive(self.archive_path, cache_size=0)
+        codec = archive._codec
+        calls = []
+        class SlowCodec(object):
+            def decompress(self, data, dictionary=b""):
+                calls.append(data)
+                time.sleep(0.2)
+                return codec.decompress(data, dictionary)
+        archive._codec = SlowCodec()
+        results = []
+        def read():
+            results.append(archive.get("0/HP/printer1.ppd"))
+        threads = [threading.Thread(target=read) for i in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            archive.close()
+        self.assertEqual(results, [self.ppds["HP/printer1.ppd"]] * 4)
+        self.assertEqual(len(calls), len(set(calls)))
+
+    def test_aget(self):
+        """Test getting PPDs from coroutines."""
+        async def read():
+            return await asyncio.gather(*[
+                self.archive.aget("0/" + filename) for filename in self.ppds])
+        self.assertEqual(asyncio.run(read()), list(self.ppds.values()))
+        with self.assertRaises(KeyError):
+            asyncio.run(self.archive.aget("0/HP/missing.ppd"))
+
+    def test_aget_loops(self):
+        """Test that an Archive serves several event loops in turn."""
+        archive = pyppd.reader.Archive(self.archive_path, jobs=2,
+                                       max_pending=1)
+        uris = ["0/" + filename for filename in self.ppds] * 3
+        async def read():
+            # More requests than max_pending, so that some of them wait
+            return await asyncio.gather(*[archive.aget(uri) for uri in uris])
+        try:
+            for loop in range(2):
+                self.assertEqual(asyncio.run(read()),
+                                 list(self.ppds.values()) * 3)
+        finally:
+            archive.close()
+    
+    def test_aiter_ppds(self):
+        """Test iterating asynchronously over a batch of PPDs."""
+        archive = pyppd.reader.Archive(self.archive_path, jobs=2,
+                                       max_pending=3)
+        uris = ["0/" + filename for filename in self.ppds]
+        async def read():
+            return [ppd async for ppd in archive.aiter_ppds(uris)]
+        try:
+            self.assertEqual(asyncio.run(read()),
+                             [("0/" + filename, content)
+                              for filename, content in self.ppds.items()])
+        finally:
+            archive.close()
+
+    def test_not_an_archive(self):
+        """Test files other than current archives are rejected."""
+        path = os.path.join(self.test_dir, "HP", "printer1.ppd")
+        with self.assertRaises(pyppd.reader.ArchiveError):
+            pyppd.reader.Archive(path)
+        path = os.path.join(self.test_dir, "empty")
+        open(path, "wb").close()
+        with self.assertRaises(pyppd.reader.ArchiveError):
+            pyppd.reader.Archive(path)
+        # A zip whose index is corrupt
+        path = os.path.join(self.test_dir, "corrupt")
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("index", b"\xff")
+            z.writestr("dictionary", b"")
+            z.writestr("list", b"")
+        try:
+            pyppd.reader.Archive(path)
+        except pyppd.reader.ArchiveError as e:
+            # Its traceback keeps the half-built Archive alive
+            error = e
+        else:
+            self.fail("ArchiveError not raised")
+        if os.path.exists("/proc/self/maps"):
+            with open("/proc/self/maps") as maps:
+                self.assertNotIn(path, maps.read())
+
+    def test_unavailable_codec(self):
+        """Test archives whose codec can't be used are closed, not leaked."""
+        ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+            self.test_dir, codec="zlib")
+        path = os.path.join(self.test_dir, "foo-ppdfile")
+        with open(path, "wb") as f:
+            f.write(pyppd.archiver.build(ppds_index, ppds_list,
+                                         ppds_payload._replace(codec="foo")))
+        try:
+            pyppd.reader.Archive(path)
+        except pyppd.compressor.CodecError as e:
+            # Its traceback keeps the half-built Archive alive
+            error = e
+        else:
+            self.fail("CodecError not raised")
+        if os.path.exists("/proc/self/maps"):
+            with open("/proc/self/maps") as maps:
+                self.assertNotIn(path, maps.read())
+
+if __name__ == '__main__':
+    unittest.main()
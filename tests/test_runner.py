@@ -6,6 +6,7 @@ import os
 import sys
 import shutil
 from io import StringIO
+import pyppd.archiver
 import pyppd.runner
 
 class TestRunner(unittest.TestCase):
@@ -65,6 +66,37 @@ class TestRunner(unittest.TestCase):
         self.assertEqual(args[0], self.test_dir)
         self.assertEqual(options.output, output_file)
     
+    def test_parse_args_index(self):
+        """Test command-line argument parsing for the index command."""
+        archive_file = os.path.join(self.test_dir, "archive")
+        with open(archive_file, "wb") as f:
+            f.write(b"")
+        sys.argv = ['pyppd', '-b', '4096', 'index', archive_file]
+        options, args = pyppd.runner.parse_args()
+        
+        # Archives are reindexed in place by default
+        self.assertEqual(args, ['index', archive_file])
+        self.assertEqual(options.output, archive_file)
+        self.assertEqual(options.block_size, 4096)
+    
+    def test_parse_args_jobs(self):
+        """Test parsing the number of jobs, one per CPU by default."""
+        sys.argv = ['pyppd', self.test_dir]
+        self.assertIsNone(pyppd.runner.parse_args()[0].jobs)
+        sys.argv = ['pyppd', '-j', '4', self.test_dir]
+        self.assertEqual(pyppd.runner.parse_args()[0].jobs, 4)
+        sys.argv = ['pyppd', '--jobs', '0', self.test_dir]
+        with self.assertRaises(SystemExit):
+            pyppd.runner.parse_args()
+    
+    def test_parse_args_hot(self):
+        """Test that a negative number of hot PPDs is rejected."""
+        sys.argv = ['pyppd', '--hot', '0', self.test_dir]
+        self.assertEqual(pyppd.runner.parse_args()[0].hot, 0)
+        sys.argv = ['pyppd', '--hot', '-3', self.test_dir]
+        with self.assertRaises(SystemExit):
+            pyppd.runner.parse_args()
+    
     def test_run(self):
         """Test running the command."""
         sys.argv = ['pyppd', '-o', 'test-output', self.test_dir]
@@ -78,6 +110,64 @@ class TestRunner(unittest.TestCase):
         # Clean up the output file
         os.unlink('test-output')
 
+    def test_run_no_ppds(self):
+        """Test that nothing is written when there are no PPDs."""
+        empty_dir = os.path.join(self.test_dir, "empty")
+        os.makedirs(empty_dir)
+        sys.argv = ['pyppd', '-o', 'test-output', empty_dir]
+        
+        with self.assertRaises(SystemExit):
+            pyppd.runner.run()
+        self.assertFalse(os.path.exists('test-output'))
+        self.assertFalse([f for f in os.listdir('.') if f.startswith('.test-output.')])
+
+    def test_run_index_not_archive(self):
+        """Test that indexing a file other than an archive is refused."""
+        not_archive = os.path.join(self.test_dir, "not-archive")
+        with open(not_archive, "wb") as f:
+            f.write(b"#!/bin/sh\n")
+        sys.argv = ['pyppd', 'index', not_archive]
+        
+        with self.assertRaises(SystemExit) as cm:
+            pyppd.runner.run()
+        self.assertEqual(cm.exception.code, 2)
+        with open(not_archive, "rb") as f:
+            self.assertEqual(f.read(), b"#!/bin/sh\n")
+    
+    def test_run_index_unavailable_codec(self):
+        """Test that indexing an archive whose codec can't be used is
+        refused."""
+        ppds_index, ppds_list, ppds_payload = pyppd.archiver.compress(
+            self.test_dir)
+        archive = pyppd.archiver.build(ppds_index, ppds_list,
+                                       ppds_payload._replace(codec="foo"))
+        archive_file = os.path.join(self.test_dir, "archive")
+        with open(archive_file, "wb") as f:
+            f.write(archive)
+        sys.argv = ['pyppd', 'index', archive_file]
+        
+        with self.assertRaises(SystemExit) as cm:
+            pyppd.runner.run()
+        self.assertEqual(cm.exception.code, 2)
+        with open(archive_file, "rb") as f:
+            self.assertEqual(f.read(), archive)
+    
+    def test_run_check(self):
+        """Test checking PPDs, which fails on problems."""
+        import json
+        sys.argv = ['pyppd', 'check', self.test_dir]
+        pyppd.runner.run()
+        report = json.loads(sys.stdout.getvalue())
+        self.assertEqual(report["ppds"], 1)
+        self.assertEqual(report["errors"], [])
+        self.assertFalse(os.path.exists('pyppd-ppdfile'))
+        
+        with open(os.path.join(self.test_dir, "bad.ppd"), "wb") as f:
+            f.write(b"*LanguageVersion: English\n")
+        with self.assertRaises(SystemExit) as cm:
+            pyppd.runner.run()
+        self.assertEqual(cm.exception.code, 1)
+
 if __name__ == '__main__':
     unittest.main()
 